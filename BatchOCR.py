@@ -0,0 +1,87 @@
+# Batched inference for manga-ocr, instead of one forward pass
+# per crop, the crops are stacked and generated together.
+import os
+
+DEFAULT_BATCH_SIZE = 8
+# model used by manga-ocr, also part of the key of the ocr cache
+OCR_MODEL_ID = "kha-white/manga-ocr-base"
+MAX_TEXT_LENGTH = 300
+
+# what runs the model, picked with GOMATA_OCR_ENGINE (see OnnxOCR.py)
+OCR_ENGINES = ('torch', 'onnx', 'onnx-int8')
+DEFAULT_OCR_ENGINE = 'torch'
+
+
+def getOCREngineName(name=None):
+    name = name if name else os.environ.get('GOMATA_OCR_ENGINE', DEFAULT_OCR_ENGINE)
+    if not name in OCR_ENGINES:
+        raise ValueError(f'Unknown ocr engine "{name}"')
+    return name
+
+
+def getOCREngineId(engine_name):
+    # the other engines may not give exactly the same text,
+    # so they have their own entries on the ocr cache.
+    if engine_name == 'torch':
+        return OCR_MODEL_ID
+    return f'{OCR_MODEL_ID}:{engine_name}'
+
+
+def prepareOCREngine(engine_name):
+    # what has to be done once before creating the engine, for the onnx
+    # engines the export of the model, returns where the model is.
+    engine_name = getOCREngineName(engine_name)
+    if engine_name == 'torch':
+        return None
+    from OnnxOCR import prepareOnnxModel
+    return prepareOnnxModel(quantized=engine_name == 'onnx-int8')
+
+
+def createOCREngine(engine_name, number_threads=None, model_dir=None):
+    engine_name = getOCREngineName(engine_name)
+    if engine_name == 'torch':
+        from manga_ocr import MangaOcr
+        return MangaOcr(OCR_MODEL_ID)
+    from OnnxOCR import OnnxOCREngine
+    if model_dir == None:
+        model_dir = prepareOCREngine(engine_name)
+    return OnnxOCREngine(model_dir, number_threads)
+
+
+def getAspectRatio(image):
+    (width, height) = image.size
+    return width / max(1, height)
+
+
+def groupByAspectRatio(items, batch_size, get_image=lambda item: item):
+    # the model resizes every crop to the same input size, but crops with
+    # a similar shape tend to have a similar amount of text, so grouping
+    # them keeps short bubbles from waiting on the long ones to decode.
+    ordered = sorted(items, key=lambda item: getAspectRatio(get_image(item)))
+    return [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+
+
+def canRunBatched(manga_ocr_instance):
+    return all(hasattr(manga_ocr_instance, attr)
+               for attr in ('processor', 'tokenizer', 'model'))
+
+
+def recognizeBatch(manga_ocr_instance, images):
+    if hasattr(manga_ocr_instance, 'recognizeBatch'):
+        # an engine that makes its own batches (like the ocr daemon client)
+        return manga_ocr_instance.recognizeBatch(images)
+    if not canRunBatched(manga_ocr_instance):
+        # not a MangaOcr instance, so there is no model to batch on
+        return [manga_ocr_instance(image) for image in images]
+
+    from manga_ocr.ocr import post_process
+
+    # same preprocessing that MangaOcr.__call__ does per image
+    images = [(image if image.mode == "L" else image.convert("L")).convert("RGB")
+              for image in images]
+    pixel_values = manga_ocr_instance.processor(images, return_tensors="pt").pixel_values
+
+    model = manga_ocr_instance.model
+    output = model.generate(pixel_values.to(model.device), max_length=MAX_TEXT_LENGTH)
+    texts = manga_ocr_instance.tokenizer.batch_decode(output.cpu(), skip_special_tokens=True)
+    return [post_process(text) for text in texts]
@@ -0,0 +1,210 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+from PagePrefetcher import decodePage
+from PageBuffer import PageBuffer
+import threading
+import math
+
+# the pages are reduced to about this size before looking for bubbles
+DETECTION_SIZE = 1024
+WHITE_THRESHOLD = 200
+# bubble size, relative to the area of the page
+MIN_BUBBLE_AREA = 0.0008
+MAX_BUBBLE_AREA = 0.12
+# white area over the area of its bounding box (an ellipse is ~0.78)
+MIN_FILL_RATIO = 0.4
+MAX_ASPECT_RATIO = 8
+# fraction of dark pixels inside, an empty bubble has no text to read
+MIN_INK_RATIO = 0.01
+MAX_INK_RATIO = 0.45
+# a proposal that covers this much of an existing rect is the same region
+MAX_OVERLAP = 0.5
+
+
+def reduceByMinimum(gray, factor):
+    # the darkest pixel of each block, so the thin outlines of the
+    # bubbles are kept and they do not leak into the background.
+    import numpy
+    if factor <= 1:
+        return gray
+    height = (gray.shape[0] // factor) * factor
+    width = (gray.shape[1] // factor) * factor
+    blocks = gray[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    return blocks.min(axis=(1, 3))
+
+
+def getRuns(mask):
+    # the horizontal runs of True of every row, as (row, start, end)
+    import numpy
+    padded = numpy.zeros((mask.shape[0], mask.shape[1] + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = mask
+    changes = numpy.diff(padded, axis=1)
+    (start_rows, starts) = numpy.nonzero(changes == 1)
+    (_, ends) = numpy.nonzero(changes == -1)
+    return (start_rows, starts, ends)
+
+
+def labelRuns(rows, starts, ends, width):
+    # connected components (4 neighbours) over the runs instead of the
+    # pixels, two runs of consecutive rows are connected when they overlap.
+    import numpy
+    number_runs = len(rows)
+    key_size = width + 1
+    start_keys = rows * key_size + starts
+    end_keys = rows * key_size + ends
+    previous_row = rows - 1
+    first = numpy.searchsorted(end_keys, previous_row * key_size + starts, side='right')
+    last = numpy.searchsorted(start_keys, previous_row * key_size + ends, side='left')
+    counts = numpy.maximum(last - first, 0)
+    lower = numpy.repeat(numpy.arange(number_runs), counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    upper = numpy.repeat(first, counts) + offsets
+
+    # hook the roots to the smallest label and compress, until nothing changes
+    labels = numpy.arange(number_runs)
+    while True:
+        lower_labels = labels[lower]
+        upper_labels = labels[upper]
+        smallest = numpy.minimum(lower_labels, upper_labels)
+        hooked = labels.copy()
+        numpy.minimum.at(hooked, lower_labels, smallest)
+        numpy.minimum.at(hooked, upper_labels, smallest)
+        while True:
+            compressed = hooked[hooked]
+            if numpy.array_equal(compressed, hooked):
+                break
+            hooked = compressed
+        if numpy.array_equal(hooked, labels):
+            return labels
+        labels = hooked
+
+
+def findBubbles(gray):
+    # gray is a 2d uint8 array, returns the (x, y, w, h) of the regions
+    # that look like speech bubbles: closed white areas, not touching the
+    # border of the page, round enough and with some dark text inside.
+    import numpy
+    (page_height, page_width) = gray.shape
+    factor = max(1, math.ceil(max(page_height, page_width) / DETECTION_SIZE))
+    small = reduceByMinimum(gray, factor)
+    (height, width) = small.shape
+    if height < 2 or width < 2:
+        return []
+
+    # a bit lower for the pages scanned over a gray paper
+    white_threshold = min(WHITE_THRESHOLD, float(numpy.percentile(small, 95)) - 30)
+    white = small > white_threshold
+    dark = small < white_threshold / 2
+
+    (rows, starts, ends) = getRuns(white)
+    if len(rows) == 0:
+        return []
+    labels = labelRuns(rows, starts, ends, width)
+    (component_ids, run_components) = numpy.unique(labels, return_inverse=True)
+    number_components = len(component_ids)
+
+    areas = numpy.bincount(run_components, weights=ends - starts, minlength=number_components)
+    tops = numpy.full(number_components, height)
+    bottoms = numpy.zeros(number_components, dtype=numpy.int64)
+    lefts = numpy.full(number_components, width)
+    rights = numpy.zeros(number_components, dtype=numpy.int64)
+    numpy.minimum.at(tops, run_components, rows)
+    numpy.maximum.at(bottoms, run_components, rows + 1)
+    numpy.minimum.at(lefts, run_components, starts)
+    numpy.maximum.at(rights, run_components, ends)
+
+    box_widths = rights - lefts
+    box_heights = bottoms - tops
+    box_areas = numpy.maximum(box_widths * box_heights, 1)
+    page_area = width * height
+    touches_border = (tops == 0) | (lefts == 0) | (bottoms == height) | (rights == width)
+    aspect = numpy.maximum(box_widths, box_heights) / numpy.maximum(numpy.minimum(box_widths, box_heights), 1)
+
+    # the ink inside of each box, from the sums of the dark pixels
+    # (the margin leaves out the outline of the bubble)
+    integral = numpy.zeros((height + 1, width + 1), dtype=numpy.int64)
+    integral[1:, 1:] = dark.cumsum(axis=0).cumsum(axis=1)
+    margin_x = box_widths // 8
+    margin_y = box_heights // 8
+    inner_top = tops + margin_y
+    inner_bottom = numpy.maximum(bottoms - margin_y, inner_top + 1)
+    inner_left = lefts + margin_x
+    inner_right = numpy.maximum(rights - margin_x, inner_left + 1)
+    ink = (integral[inner_bottom, inner_right] - integral[inner_top, inner_right]
+           - integral[inner_bottom, inner_left] + integral[inner_top, inner_left])
+    ink_ratio = ink / numpy.maximum((inner_bottom - inner_top) * (inner_right - inner_left), 1)
+
+    is_bubble = (~touches_border
+                 & (areas >= MIN_BUBBLE_AREA * page_area)
+                 & (areas <= MAX_BUBBLE_AREA * page_area)
+                 & (areas / box_areas >= MIN_FILL_RATIO)
+                 & (aspect <= MAX_ASPECT_RATIO)
+                 & (ink_ratio >= MIN_INK_RATIO)
+                 & (ink_ratio <= MAX_INK_RATIO))
+
+    bubbles = [(int(lefts[i] * factor), int(tops[i] * factor),
+                int(box_widths[i] * factor), int(box_heights[i] * factor))
+               for i in numpy.nonzero(is_bubble)[0]]
+    # manga reading order, by bands from the top and right to left
+    band_height = max(1, page_height // 8)
+    bubbles.sort(key=lambda box: (box[1] // band_height, -box[0]))
+    return bubbles
+
+
+def getOverlap(a, b):
+    (ax, ay, aw, ah) = a
+    (bx, by, bw, bh) = b
+    width = min(ax + aw, bx + bw) - max(ax, bx)
+    height = min(ay + ah, by + bh) - max(ay, by)
+    if width <= 0 or height <= 0:
+        return 0
+    return (width * height) / max(1, min(aw * ah, bw * bh))
+
+
+def filterNewRegions(definitions, existing_definitions):
+    # leave out the proposals that are already covered by a rect
+    return [definition for definition in definitions
+            if all(getOverlap(definition, existing) < MAX_OVERLAP
+                   for existing in existing_definitions)]
+
+
+class BubbleDetector(QObject):
+    # Looks for the speech bubbles of the pages on a background worker,
+    # decoding the page there when there is no page buffer for it yet.
+    # emits (generation, page_index, path, list of (x, y, w, h), page_buffer)
+    regionsDetected = pyqtSignal(int, int, str, object, object)
+    detectionFailed = pyqtSignal(int, int, str)
+
+    def __init__(self):
+        super().__init__()
+        # one worker, to not take the cpu from the ocr
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def cancelPending(self):
+        with self.lock:
+            self.generation += 1
+
+    def request(self, page_index, path, page_buffer=None):
+        self.executor.submit(self.runRequest, self.generation, page_index, path, page_buffer)
+
+    def runRequest(self, generation, page_index, path, page_buffer):
+        with self.lock:
+            if generation != self.generation:
+                return
+        try:
+            if page_buffer == None:
+                image = decodePage(path)
+                if image.isNull():
+                    raise ValueError(f'can not decode {path}')
+                page_buffer = PageBuffer(image)
+            definitions = findBubbles(page_buffer.getArray())
+        except Exception as e:
+            self.detectionFailed.emit(generation, page_index, f'{e}')
+            return
+        self.regionsDetected.emit(generation, page_index, path, definitions, page_buffer)
+
+    def shutdown(self):
+        self.cancelPending()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,169 @@
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+import time
+
+# 64 MB of recognized text is a lot of bubbles
+DEFAULT_OCR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def getUserCacheDir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    path = os.path.join(base, 'gomata')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class OCRCache():
+    # Keeps the recognized text of every crop on disk, the key is
+    # the hash of the pixels the model sees plus the model name,
+    # so the same bubble is never recognized twice.
+    def __init__(self, model_id, path=None, max_bytes=DEFAULT_OCR_CACHE_MAX_BYTES):
+        self.model_id = model_id
+        self.path = path if path else os.path.join(getUserCacheDir(), 'ocr_cache.sqlite')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # used from the ocr worker thread and from the gui thread
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS ocr_results (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL)""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results (last_used)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+
+    def makeKey(self, image):
+        # the model works over the grayscale version of the crop,
+        # so the key does not change with the format of the pixmap.
+        gray = image if image.mode == "L" else image.convert("L")
+        digest = hashlib.sha256()
+        digest.update(self.model_id.encode('utf-8'))
+        digest.update(f'{gray.size[0]}x{gray.size[1]}'.encode('utf-8'))
+        digest.update(gray.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT text FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key, text):
+        size = len(key) + len(text.encode('utf-8'))
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row != None:
+                self.total_bytes -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()))
+            self.total_bytes += size
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        # drop the least recently used results until there is room,
+        # leaving some slack to not evict again on the next insert.
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        to_delete = []
+        rows = self.connection.execute(
+            "SELECT key, size FROM ocr_results ORDER BY last_used ASC")
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM ocr_results WHERE key = ?", to_delete)
+
+    def getStats(self):
+        with self.lock:
+            count = self.connection.execute("SELECT COUNT(*) FROM ocr_results").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': count,
+            'bytes': self.total_bytes,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class TranslationCache():
+    # Translations already done, keyed by the text and the languages
+    # and backend used, so recurring names and sfx are translated once.
+    def __init__(self, path=None):
+        self.path = path if path else os.path.join(getUserCacheDir(), 'translation_cache.sqlite')
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                text TEXT NOT NULL,
+                src TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (text, src, dest, backend))""")
+        self.connection.commit()
+
+    def get(self, text, src, dest, backend):
+        with self.lock:
+            row = self.connection.execute(
+                """SELECT translation FROM translations
+                WHERE text = ? AND src = ? AND dest = ? AND backend = ?""",
+                (text, src, dest, backend)).fetchone()
+            if row == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, text, src, dest, backend, translation):
+        with self.lock:
+            self.connection.execute(
+                """INSERT OR REPLACE INTO translations
+                (text, src, dest, backend, translation) VALUES (?, ?, ?, ?, ?)""",
+                (text, src, dest, backend, translation))
+            self.connection.commit()
+
+    def getStats(self):
+        with self.lock:
+            count = self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': count,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
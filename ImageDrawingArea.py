@@ -1,11 +1,14 @@
-from PyQt6.QtWidgets import QGraphicsView, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPolygonItem, QGraphicsTextItem
-from PyQt6.QtGui import QPainter, QPen, QColor, QBrush, QTransform, QPolygonF, QFont
+from PyQt6.QtWidgets import QGraphicsView, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPolygonItem, QGraphicsTextItem, QGraphicsRectItem, QGraphicsPathItem
+from PyQt6.QtGui import QPainter, QPen, QColor, QBrush, QTransform, QPolygonF, QFont, QPainterPath, QPixmap
 from PyQt6.QtCore import Qt, QRectF, QPointF, QTimer, QLineF
 from PyQt6 import sip
 from math import sqrt
 from uuid import uuid4 as uuid
+from SpatialIndex import SpatialGrid
 
 PEN_LINE_SIZE = 4
+# miliseconds between each step of the dotted lines animation
+ANIMATION_INTERVAL = 100
 
 def getVectorMagnitude(vector):
     return sqrt( vector.x()**2 +  vector.y()**2 )
@@ -26,17 +29,71 @@ class AnimatedDottedLine(QGraphicsLineItem):
         # Dash offset for animation
         self.dash_offset = 0
 
-    def advance(self):
-        if sip.isdeleted(self): # the item was already deleted
-            print('item was deleted, do nothing')
+    def setPoints(self, start, end):
+        if arePointsEqual(self.start, start) and arePointsEqual(self.end, end):
             return
-        
+        self.start = start
+        self.end = end
+        self.setLine(start.x(), start.y(), end.x(), end.y())
+
+    def advance(self):
+        # returns False when the item was already deleted with its scene
+        if sip.isdeleted(self):
+            return False
+
         # Update the dash offset to create the animation effect
         self.dash_offset += 1  # Adjust speed here
         if self.dash_offset >= 8:  # Reset offset to loop the animation
             self.dash_offset = 0
         self.pen.setDashOffset(self.dash_offset)
         self.setPen(self.pen)
+        return True
+
+
+class AnimationClock():
+    # One timer for the whole scene, instead of one per rect, it only
+    # advances the rects that can be seen on the view (or the focused one)
+    # and stops when there is nothing to animate or the window is inactive.
+    def __init__(self, view):
+        self.view = view
+        self.rects = set()
+        self.is_paused = False
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.tick)
+
+    def register(self, rect):
+        self.rects.add(rect)
+        self.updateTimer()
+
+    def unregister(self, rect):
+        self.rects.discard(rect)
+        self.updateTimer()
+
+    def clear(self):
+        self.rects = set()
+        self.updateTimer()
+
+    def setPaused(self, value):
+        self.is_paused = value
+        self.updateTimer()
+
+    def updateTimer(self):
+        should_run = len(self.rects) > 0 and not self.is_paused
+        if should_run and not self.timer.isActive():
+            self.timer.start(ANIMATION_INTERVAL)
+        elif not should_run and self.timer.isActive():
+            self.timer.stop()
+
+    def tick(self):
+        visible_area = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        finished = []
+        for rect in self.rects:
+            if rect.is_mouse_hovering or rect.isInsideArea(visible_area):
+                if not rect.updateLineAnim():
+                    finished.append(rect)
+        # nothing left of them to animate
+        for rect in finished:
+            self.unregister(rect)
 
 
 HOTSPOT_NONE = -1
@@ -51,6 +108,45 @@ def arePointsEqual(a,b):
     return (int(a.x()) == int(b.x()) and
             int(a.y()) == int(b.y()))
 
+ARROW_BRUSH_COLOR = QColor(255,0,255)
+
+def getArrowPolygons(point_a, point_b):
+    # returns the polygons of the line and the point of an arrow
+    # from point_a to point_b, already on scene coordinates.
+    polygon_line = QPolygonF([
+        QPointF(0, -5),
+        QPointF(0, 5),
+        QPointF(10, 5),
+        QPointF(10, -5),
+    ])
+
+    polygon_arrow_point = QPolygonF([
+        QPointF(-5, -5),
+        QPointF(-5, 5),
+        QPointF(2, 0),
+    ])
+
+    # Calculate the scaling factor and rotation angle
+    line = QLineF(point_a, point_b)
+    scale_x = line.length() / 10  # Scale to fit the length between points
+    scale_y = 1.0  # Maintain aspect ratio (or adjust as needed)
+    angle = -line.angle()  # Rotation angle (negative because Qt's y-axis is inverted)
+
+    # Apply scaling and rotation using QTransform
+    transform_a = QTransform()
+    transform_a.translate(point_a.x(), point_a.y())  # Move to the starting point
+    transform_a.rotate(angle)  # Rotate
+    transform_a.scale(scale_x, scale_y)  # Scale
+
+    scale_arrow = max(5, min(8, scale_x))
+    # Apply scaling and rotation using QTransform
+    transform_b = QTransform()
+    transform_b.translate(point_b.x(), point_b.y())  # Move to the starting point
+    transform_b.scale(scale_arrow,scale_arrow)
+    transform_b.rotate(angle)
+
+    return (transform_a.map(polygon_line), transform_b.map(polygon_arrow_point))
+
 class Arrow():
     def __init__(self, start, end):
         self.start = start
@@ -68,23 +164,10 @@ class Arrow():
 
     def render(self):
         self.clearFromScene()
-        point_a = self.start
-        point_b = self.end
-        polygon_line = QPolygonF([
-            QPointF(0, -5),
-            QPointF(0, 5),
-            QPointF(10, 5),
-            QPointF(10, -5),
-        ])
-
-        polygon_arrow_point = QPolygonF([
-            QPointF(-5, -5),
-            QPointF(-5, 5),
-            QPointF(2, 0),
-        ])
+        (polygon_line, polygon_arrow_point) = getArrowPolygons(self.start, self.end)
 
         # Create a QGraphicsPolygonItem
-        brush = QBrush(QColor(255,0,255))
+        brush = QBrush(ARROW_BRUSH_COLOR)
         pen = QPen(Qt.PenStyle.NoPen)
         poly_item_a = QGraphicsPolygonItem(polygon_line)
         poly_item_a.setBrush(brush)
@@ -94,36 +177,78 @@ class Arrow():
         poly_item_b.setBrush(brush)
         poly_item_b.setPen(pen)
 
-        # Calculate the scaling factor and rotation angle
-        line = QLineF(point_a, point_b)
-        scale_x = line.length() / 10  # Scale to fit the length between points
-        scale_y = 1.0  # Maintain aspect ratio (or adjust as needed)
-        angle = -line.angle()  # Rotation angle (negative because Qt's y-axis is inverted)
-
-        # Apply scaling and rotation using QTransform
-        transform_a = QTransform()
-        transform_a.translate(point_a.x(), point_a.y())  # Move to the starting point
-        transform_a.rotate(angle)  # Rotate
-        transform_a.scale(scale_x, scale_y)  # Scale
-
-        poly_item_a.setTransform(transform_a)
-
-        scale_arrow = max(5, min(8, scale_x))
-        # Apply scaling and rotation using QTransform
-        transform_b = QTransform()
-        transform_b.translate(point_b.x(), point_b.y())  # Move to the starting point
-        transform_b.scale(scale_arrow,scale_arrow)
-        transform_b.rotate(angle)
-
-        poly_item_b.setTransform(transform_b)
-
-
         # Add the pixmap item to the scene
         self.scene.addItem(poly_item_a)
         self.arrow_line_item = poly_item_a
         self.scene.addItem(poly_item_b)
         self.arrow_point_item = poly_item_b
 
+class OrderArrowsLayer():
+    # All the arrows of the reading order drawn by a single path item.
+    # While a rect is being moved, its one or two arrows go to a second,
+    # small, path item, so each mouse move only rebuilds those.
+    def __init__(self):
+        self.scene = None
+        self.centers = []
+        self.index_of = {}
+        self.static_item = None
+        self.active_item = None
+        self.active_index = None
+
+    def createItem(self):
+        item = QGraphicsPathItem()
+        item.setBrush(QBrush(ARROW_BRUSH_COLOR))
+        item.setPen(QPen(Qt.PenStyle.NoPen))
+        self.scene.addItem(item)
+        return item
+
+    def clear(self):
+        for item in (self.static_item, self.active_item):
+            if item and not sip.isdeleted(item) and item.scene():
+                item.scene().removeItem(item)
+        self.static_item = None
+        self.active_item = None
+        self.active_index = None
+        self.centers = []
+        self.index_of = {}
+
+    def buildPath(self, arrow_indexes):
+        # the arrow at index i goes from the rect i to the rect i+1
+        path = QPainterPath()
+        path.setFillRule(Qt.FillRule.WindingFill)
+        for index in arrow_indexes:
+            for polygon in getArrowPolygons(self.centers[index], self.centers[index + 1]):
+                path.addPolygon(polygon)
+        return path
+
+    def getArrowsOfRect(self, index):
+        return [i for i in (index - 1, index) if i >= 0 and i < len(self.centers) - 1]
+
+    def setRects(self, rects, scene):
+        self.clear()
+        self.scene = scene
+        self.centers = [rect.getCenter() for rect in rects]
+        self.index_of = { rect.id: index for index, rect in enumerate(rects) }
+        if len(self.centers) < 2:
+            return
+        self.static_item = self.createItem()
+        self.static_item.setPath(self.buildPath(range(len(self.centers) - 1)))
+
+    def moveRect(self, rect):
+        index = self.index_of.get(rect.id)
+        if index == None or not self.static_item:
+            return
+        self.centers[index] = rect.getCenter()
+        moved_arrows = self.getArrowsOfRect(index)
+        if self.active_index != index:
+            # take the arrows of this rect out of the big path, only once
+            self.active_index = index
+            self.static_item.setPath(self.buildPath(
+                [i for i in range(len(self.centers) - 1) if not i in moved_arrows]))
+            if not self.active_item:
+                self.active_item = self.createItem()
+        self.active_item.setPath(self.buildPath(moved_arrows))
+
 class ImageRect():
     def __init__(self, initial_pos, end_pos=None, id=None, detected=None, machine_translation=None):
         self.item_reference = None
@@ -143,15 +268,15 @@ class ImageRect():
         # Create an animated dotted line
         self.animated_lines = []
         self.animated_lines_references = []
+        self.rendered_color = None
+        self.rendered_hovering = None
+        self.rendered_text = None
 
 
-        # Set up a timer for animation
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.updateLineAnim)
-        self.timer.start(100)
-
         self.scene = None
-        self.image = None
+        # the page the rect is on, the thumbnails are painted from it
+        # when they are shown, the rect keeps no copy of its pixels.
+        self.source_pixmap = None
 
         # other used data.
         self.id = id if id != None else uuid()
@@ -256,13 +381,37 @@ class ImageRect():
         y = int(self._origin.y())
         return (x, y, int(self._end.x() - x), int(self._end.y()-y) )
     
+    def getImageKey(self):
+        # changes when the thumbnail has to be painted again
+        if self.source_pixmap == None:
+            return None
+        return (self.source_pixmap.cacheKey(), self.getDefinition())
+
+    def makeThumbnail(self, size):
+        if self.source_pixmap == None:
+            return None
+        (x, y, w, h) = self.getDefinition()
+        scale = min(size / max(1, w), size / max(1, h))
+        thumbnail = QPixmap(max(1, int(w * scale)), max(1, int(h * scale)))
+        thumbnail.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(thumbnail)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawPixmap(QRectF(thumbnail.rect()), self.source_pixmap, QRectF(x, y, w, h))
+        painter.end()
+        return thumbnail
+
     def getCenter(self):
         (x,y,w,h) = self.getDefinition()
         return QPointF( x+(w/2), y+(h/2) )
 
+    def isInsideArea(self, area):
+        return QRectF(*self.getDefinition()).intersects(area)
+
     def updateLineAnim(self):
-        for line in self.animated_lines:
-            line.advance()
+        # the lines deleted with the scene are dropped, returns
+        # False when there are no lines left to animate.
+        self.animated_lines = [line for line in self.animated_lines if line.advance()]
+        return len(self.animated_lines) > 0
     
     def createLines(self):
         self.animated_lines = [
@@ -297,20 +446,52 @@ class ImageRect():
         return -1
 
     def clearFromScene(self):
+        # only when the rect is deleted, the items are kept
+        # between renders and just updated in place.
         if self.text_item_ref:
             self.scene.removeItem(self.text_item_ref)
             self.text_item_ref = None
         if self.item_reference:
             self.scene.removeItem(self.item_reference)
+            self.item_reference = None
         for line in self.animated_lines:
             self.scene.removeItem(line)
         self.animated_lines = []
 
-    
+    def createItems(self):
+        self.item_reference = QGraphicsRectItem()
+        self.scene.addItem(self.item_reference)
+        self.createLines()
+        for line in self.animated_lines:
+            self.scene.addItem(line)
+        self.rendered_color = None
+        self.rendered_hovering = None
+        self.rendered_text = None
+
+    def updateTextItem(self, x, y, w):
+        has_text =  (self.machine_translation and  len(self.machine_translation) > 0)
+        show_text = bool(has_text and self.show_text_overlay)
+        if not show_text:
+            if self.text_item_ref:
+                self.text_item_ref.setVisible(False)
+            return
+
+        if not self.text_item_ref:
+            self.text_item_ref = QGraphicsTextItem()
+            self.text_item_ref.setFont(QFont("Arial", 12))  # Set font and size
+            self.text_item_ref.setZValue(1) # over the lines of the other rects
+            self.scene.addItem(self.text_item_ref)
+        if self.rendered_text != self.machine_translation:
+            self.text_item_ref.setHtml(f"<span style='color: yellow; background:rgba(5, 5, 5, 80%); '>{self.machine_translation}</span>")  # Set formatted text
+            self.rendered_text = self.machine_translation
+        self.text_item_ref.setPos(x, y)  # Position the text
+        self.text_item_ref.setTextWidth(w)
+        self.text_item_ref.setVisible(True)
+
     def render(self):
-        self.clearFromScene()
         global PEN_LINE_SIZE
-        self.createLines()
+        if not self.item_reference:
+            self.createItems()
 
         (x,y,w,h) = self.getDefinition()
 
@@ -318,30 +499,25 @@ class ImageRect():
         self.drawable_rect.setX(x)
         self.drawable_rect.setY(y)
         self.drawable_rect.setBottomRight(self._end)
+        self.item_reference.setRect(self.drawable_rect)
+
+        # the pen and brush only change with the hover state
+        if self.rendered_color != self.use_color:
+            self.item_reference.setPen(QPen(self.use_color, PEN_LINE_SIZE, Qt.PenStyle.SolidLine))
+            self.rendered_color = self.use_color
+        if self.rendered_hovering != self._is_mouse_hovering:
+            if self._is_mouse_hovering:
+                self.item_reference.setBrush(QBrush(QColor(252, 232, 3, 30)))
+            else:
+                self.item_reference.setBrush(QBrush(Qt.BrushStyle.NoBrush))
+            self.rendered_hovering = self._is_mouse_hovering
 
-        pen = QPen(self.use_color, PEN_LINE_SIZE, Qt.PenStyle.SolidLine)
-        if self._is_mouse_hovering:
-            brush = QBrush(QColor(252, 232, 3, 30))
-            self.item_reference = self.scene.addRect(self.drawable_rect, pen, brush)
-        else:
-            self.item_reference = self.scene.addRect(self.drawable_rect, pen)
-
-        for line in self.animated_lines:
-            self.scene.addItem(line)
-
-        has_text =  (self.machine_translation and  len(self.machine_translation) > 0)
-        if has_text and self.show_text_overlay:
-            text_item = QGraphicsTextItem()
-            text_item.setHtml(f"<span style='color: yellow; background:rgba(5, 5, 5, 80%); '>{self.machine_translation}</span>")  # Set formatted text
-            text_item.setFont(QFont("Arial", 12))  # Set font and size
-            text_item.setPos(x, y)  # Position the text
-            text_item.setTextWidth(w)
+        corners = [self._origin, self._top_right, self._end, self._bottom_left]
+        for index, line in enumerate(self.animated_lines):
+            line.setPoints(corners[index], corners[(index + 1) % 4])
 
+        self.updateTextItem(x, y, w)
 
-            # Add the text item to the scene
-            self.text_item_ref = text_item
-            self.scene.addItem(text_item)
-    
     def hasPointInside(self, point):
         horizontal = point.x() > self._origin.x() and point.x() < self._end.x()
         vertical = point.y() > self._origin.y() and point.y() < self._end.y()
@@ -371,43 +547,74 @@ class ImageDrawingArea(QGraphicsView):
         # Set up the view
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
-        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
+        # only the changed areas are repainted, the page is tiled
+        # so it only paints the tiles under those areas.
+        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.SmartViewportUpdate)
         self.cursor_in_image_point = None
 
         self.pressed_keys = set()
 
         self.list_of_draw_rects = []
+        # to find the rects by id or by position without
+        # going over all the list_of_draw_rects
+        self.rects_by_id = {}
+        self.rects_order = {}
+        # only grows, so the order of a new rect is never the one of
+        # another after some rects were removed
+        self.next_rect_order = 0
+        self.spatial_index = SpatialGrid()
+        self.hovering_rects = set()
 
         self.is_showing_orden_arrows = False
         self.is_showing_overlay_text =  False
-        self.list_of_arrows = []
+        self.order_arrows = OrderArrowsLayer()
         self.highlight_current_rect_arrow = None
 
+        self.animation_clock = AnimationClock(self)
+
         self.parent = None
 
     def clearArrows(self):
-        for arrow in self.list_of_arrows:
-            arrow.clearFromScene()
-        
-        self.list_of_arrows = []
+        self.order_arrows.clear()
+
+    def indexRect(self, rect):
+        # add the rect to the indexes, or update it after it changes
+        if not rect.id in self.rects_order:
+            self.rects_order[rect.id] = self.next_rect_order
+            self.next_rect_order += 1
+        self.rects_by_id[rect.id] = rect
+        self.spatial_index.insert(rect.id, rect, rect.getDefinition())
+
+    def unindexRect(self, rect):
+        self.rects_by_id.pop(rect.id, None)
+        self.rects_order.pop(rect.id, None)
+        self.spatial_index.remove(rect.id)
+        self.hovering_rects.discard(rect)
+
+    def clearIndexes(self):
+        self.rects_by_id = {}
+        self.rects_order = {}
+        self.next_rect_order = 0
+        self.spatial_index.clear()
+        self.hovering_rects = set()
 
     def updateOrderRects(self, new_order):
-        new_list = []
-        for uuid in new_order:
-            new_list.append( *(rect for rect in self.list_of_draw_rects if rect.id == uuid) )
+        new_list = [self.rects_by_id[uuid] for uuid in new_order if uuid in self.rects_by_id]
         self.list_of_draw_rects = new_list
+        self.rects_order = { rect.id: index for index, rect in enumerate(new_list) }
+        self.next_rect_order = len(new_list)
         self.updateArrorws()
 
     def showHithlightArrow(self, uuid):
         self.removeHighlightArrow()
-        list =  [rect for rect in self.list_of_draw_rects if rect.id == uuid]
-        if len(list) == 0:
+        rect = self.rects_by_id.get(uuid)
+        if not rect:
             return
-        rect = list[0]
         (x,y,w,h) = rect.getDefinition()
         center = rect.getCenter()
         self.current_hover_rect = rect
         rect.is_mouse_hovering = True
+        self.hovering_rects.add(rect)
 
         end =  QPointF( center.x(), center.y()+(h/2)+5 )
         start = QPointF( center.x(), center.y()+(h/2)+20 )
@@ -426,24 +633,16 @@ class ImageDrawingArea(QGraphicsView):
 
 
     def updateArrorws(self):
+        # full rebuild, for when rects are added, removed or reordered
         self.clearArrows()
         if not self.is_showing_orden_arrows:
             return
-        number_rects = len(self.list_of_draw_rects)
-        if number_rects < 2:
-            return
+        self.order_arrows.setRects(self.list_of_draw_rects, self.scene())
 
-        start_index = 0
-        final_index = 1
-        while final_index < number_rects:
-            start_point = self.list_of_draw_rects[start_index].getCenter()
-            end_point = self.list_of_draw_rects[final_index].getCenter()
-            start_index = final_index
-            final_index+=1
-            arrow = Arrow(start_point, end_point)
-            arrow.scene = self.scene()
-            arrow.render()
-            self.list_of_arrows.append(arrow)
+    def updateArrowsOfRect(self, rect):
+        # only the arrows that go to and from this rect
+        if self.is_showing_orden_arrows:
+            self.order_arrows.moveRect(rect)
     
     def setIsShowingText(self, value):
         print(f'is shoginw text? {value}')
@@ -461,10 +660,11 @@ class ImageDrawingArea(QGraphicsView):
             gui_rect = ImageRect(initial, end, id, detected, machine_translation)
             gui_rect.scene = self.scene()
             gui_rect.render()
-            rect_definition = gui_rect.getDefinition()
-            gui_rect.image = self.current_pixmap.copy(*rect_definition)
+            gui_rect.source_pixmap = self.current_pixmap
             gui_rect.show_text_overlay = self.is_showing_overlay_text
             self.list_of_draw_rects.append(gui_rect)
+            self.indexRect(gui_rect)
+            self.animation_clock.register(gui_rect)
         self.informRectsUpdated()
 
     def getTextSelections(self):
@@ -481,20 +681,31 @@ class ImageDrawingArea(QGraphicsView):
     
     def clearActiveRect(self):
         if self.active_rect:
+            self.animation_clock.unregister(self.active_rect)
             self.active_rect.clearFromScene()
             self.active_rect = None
     
     def updateRectUnderMouse(self, pos):
         self.current_hover_rect = None
-        for rect in self.list_of_draw_rects:
-            # is better to run it over all the rects
-            # to only trigger the redraw call at the change of state.
-            rect.is_mouse_hovering = rect.hasPointInside(pos) 
-            if rect.is_mouse_hovering:
-                self.current_hover_rect = rect
+        # only the rects on the cell of the cursor can be under it
+        candidates = self.spatial_index.queryPoint(pos.x(), pos.y())
+        now_hovering = set(rect for rect in candidates if rect.hasPointInside(pos))
+        # only trigger the redraw call at the change of state.
+        for rect in self.hovering_rects - now_hovering:
+            rect.is_mouse_hovering = False
+        for rect in now_hovering:
+            rect.is_mouse_hovering = True
+        self.hovering_rects = now_hovering
+        if now_hovering:
+            # the last drawn rect is the one on top
+            self.current_hover_rect = max(
+                now_hovering, key=lambda rect: self.rects_order.get(rect.id, -1))
     
     def clear(self):
+        self.animation_clock.clear()
         self.list_of_draw_rects = []
+        self.clearIndexes()
+        self.clearArrows()
         self.clearActiveRect()
         self.is_active = False
 
@@ -528,6 +739,7 @@ class ImageDrawingArea(QGraphicsView):
                 self.active_rect = ImageRect(initial_pos)
                 self.active_rect.scene = self.scene()
                 self.active_rect.start = initial_pos
+                self.animation_clock.register(self.active_rect)
                 self.selected_hotspot_at_click = HOTSPOT_END
             else:
                 self.selected_hotspot_at_click = self.active_rect.getNearestHotspot(initial_pos)
@@ -558,7 +770,6 @@ class ImageDrawingArea(QGraphicsView):
             if hotspot_on_hover_rect == HOTSPOT_NONE:
                 self.active_rect.translate( current_pos - self.selection_original_pos)
                 self.selection_original_pos = current_pos
-                self.updateArrorws()
             if hotspot_on_hover_rect == HOTSPOT_END:
                 self.active_rect.end = current_pos
             if hotspot_on_hover_rect == HOTSPOT_START:
@@ -567,6 +778,9 @@ class ImageDrawingArea(QGraphicsView):
                 self.active_rect.bottom = current_pos
             if hotspot_on_hover_rect == HOTSPOT_TOP_RIGHT:
                 self.active_rect.top = current_pos
+            if self.active_rect.id in self.rects_by_id:
+                self.indexRect(self.active_rect)
+                self.updateArrowsOfRect(self.active_rect)
 
             
     def mouseReleaseEvent(self, event):
@@ -578,18 +792,16 @@ class ImageDrawingArea(QGraphicsView):
             self.selected_hotspot_at_click = HOTSPOT_NONE
             if self.active_rect:
                 if self.current_pixmap:
-                    print('creating mini image...')
-                    rect_definition = self.active_rect.getDefinition()
-                    self.active_rect.image = self.current_pixmap.copy(*rect_definition)
-                    print(self.active_rect.image)
+                    self.active_rect.source_pixmap = self.current_pixmap
                 self.active_rect.dimentions_change = False
                 self.informRectsUpdated() # to update the displayed label. :)
                 self.updateArrorws()
-            if not self.active_rect in self.list_of_draw_rects:
+            if not self.active_rect.id in self.rects_by_id:
                 magnitude = getVectorMagnitude(self.active_rect._end - self.active_rect._origin)
                 if magnitude >= 32: 
                     self.active_rect.show_text_overlay = self.is_showing_overlay_text
                     self.list_of_draw_rects.append(self.active_rect)
+                    self.indexRect(self.active_rect)
                     self.informRectsUpdated()
                     self.updateArrorws()
                 else: ## is way to small, delete it from screen.
@@ -608,8 +820,10 @@ class ImageDrawingArea(QGraphicsView):
         if Qt.Key.Key_Control in self.pressed_keys:
             if Qt.Key.Key_X in self.pressed_keys:
                 if self.current_hover_rect:
+                    self.animation_clock.unregister(self.current_hover_rect)
                     self.current_hover_rect.clearFromScene()
                     self.list_of_draw_rects.remove(self.current_hover_rect)
+                    self.unindexRect(self.current_hover_rect)
                     self.informRectsUpdated()
                     self.updateArrorws()
                     self.current_hover_rect = None
@@ -1,8 +1,10 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QScrollArea, QTabWidget, QListWidget, QListWidgetItem,
-    QSizePolicy, QPushButton, QTextEdit)
+    QLabel, QScrollArea, QTabWidget, QListView, QAbstractItemView,
+    QStyledItemDelegate, QStyle, QSizePolicy, QPushButton, QTextEdit,
+    QLineEdit, QListWidget, QListWidgetItem)
 from PyQt6.QtGui import  QIcon
-from PyQt6.QtCore import Qt, pyqtSignal, QEvent, QObject
+from PyQt6.QtCore import (Qt, pyqtSignal, QEvent, QObject, QAbstractListModel,
+    QModelIndex, QMimeData, QRect, QSize)
 from PyQt6 import sip
 
 
@@ -47,80 +49,177 @@ class ListOfImagesArea(CollapsibleSection):
     def addImageTumbnail(self, image):
         self.widget_list_images.addWidget(image)
 
+    def setImageTumbnailIcon(self, index, icon):
+        if index >= self.widget_list_images.count():
+            return
+        button = self.widget_list_images.itemAt(index).widget()
+        button.setText('')
+        button.setIcon(icon)
 
-class ReorderableListWidget(QListWidget):
-    # Custom signal to emit when the list is reordered
-    orderChanged = pyqtSignal(list)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.setDragEnabled(True)
-        self.setAcceptDrops(True)
-        self.setDropIndicatorShown(True)
-        self.setDragDropMode(QListWidget.DragDropMode.InternalMove)
+RECT_ID_ROLE = Qt.ItemDataRole.UserRole
+RECT_ROWS_MIME_TYPE = 'application/x-gomata-rect-rows'
+LIST_THUMBNAIL_SIZE = 64
+LIST_ROW_HEIGHT = 72
 
-        self.setSizePolicy(
-            QSizePolicy.Policy.Expanding,
-            QSizePolicy.Policy.Expanding 
-        )
-
-    def dropEvent(self, event):
-        # Call the base class implementation to handle the drop
-        super().dropEvent(event)
 
-        new_order = [self.item(index).data(0) for index in range(self.count())]
-        # Emit the custom signal
-        self.orderChanged.emit(new_order)
+class RectListModel(QAbstractListModel):
+    # Custom signal to emit when the list is reordered
+    orderChanged = pyqtSignal(list)
 
-class ListRectItem(QWidget):
-    def __init__(self, rect):
-        super().__init__()
-        self.show_full_details = False
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rects = []
+        # what each row showed the last time, to only
+        # repaint the ones that really changed.
+        self.row_signatures = []
+        self.thumbnails = {}
+
+    def getRowSignature(self, rect):
+        return (rect.detected_characters, rect.machine_translation, rect.getImageKey())
+
+    def setRects(self, rects):
+        old_ids = [rect.id for rect in self.rects]
+        new_ids = [rect.id for rect in rects]
+        signatures = [self.getRowSignature(rect) for rect in rects]
+
+        if old_ids == new_ids:
+            self.rects = list(rects)
+            for row, signature in enumerate(signatures):
+                if signature != self.row_signatures[row]:
+                    index = self.index(row)
+                    self.dataChanged.emit(index, index)
+            self.row_signatures = signatures
+            return
 
-        self.detail_raw_charactes_found = rect.detected_characters if rect.detected_characters else '...' 
-        self.detail_proposed_transaltion = rect.machine_translation if rect.machine_translation else '???'
+        if len(new_ids) > len(old_ids) and new_ids[:len(old_ids)] == old_ids:
+            # the common case, a new rect was drawn
+            self.beginInsertRows(QModelIndex(), len(old_ids), len(new_ids) - 1)
+            self.rects = list(rects)
+            self.row_signatures = signatures
+            self.endInsertRows()
+            return
 
-        self.base_layout = QVBoxLayout()
-        self.setLayout(self.base_layout)
-        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-        
-        self.toggle_button = QPushButton("Show more")
-        self.toggle_button.clicked.connect(self.showThisRectDetails)
+        self.beginResetModel()
+        self.rects = list(rects)
+        self.row_signatures = signatures
+        valid_ids = set(new_ids)
+        self.thumbnails = { id: thumbnail for id, thumbnail in self.thumbnails.items() if id in valid_ids }
+        self.endResetModel()
+
+    def getRect(self, index):
+        if not index.isValid() or index.row() >= len(self.rects):
+            return None
+        return self.rects[index.row()]
+
+    def getThumbnail(self, rect):
+        image_key = rect.getImageKey()
+        if image_key == None:
+            return None
+        (thumbnail_key, thumbnail) = self.thumbnails.get(rect.id, (None, None))
+        if thumbnail_key != image_key:
+            thumbnail = rect.makeThumbnail(LIST_THUMBNAIL_SIZE)
+            self.thumbnails[rect.id] = (image_key, thumbnail)
+        return thumbnail
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rects)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        rect = self.getRect(index)
+        if not rect:
+            return None
+        if role == RECT_ID_ROLE:
+            return rect.id
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.getThumbnail(rect)
+        if role == Qt.ItemDataRole.DisplayRole:
+            return rect.detected_characters if rect.detected_characters else '...'
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return rect.machine_translation
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            # drops only go between the rows, never over them
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return (Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable |
+                Qt.ItemFlag.ItemIsDragEnabled)
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [RECT_ROWS_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        # the list view moves the rows with moveRows, the mime
+        # data is just needed for the drag to start.
+        mime_data = QMimeData()
+        rows = ','.join(f'{index.row()}' for index in indexes)
+        mime_data.setData(RECT_ROWS_MIME_TYPE, rows.encode('utf-8'))
+        return mime_data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        return False
+
+    def moveRows(self, source_parent, source_row, count, destination_parent, destination_row):
+        if not self.beginMoveRows(source_parent, source_row, source_row + count - 1,
+                                  destination_parent, destination_row):
+            return False
+        moved_rects = self.rects[source_row:source_row + count]
+        moved_signatures = self.row_signatures[source_row:source_row + count]
+        del self.rects[source_row:source_row + count]
+        del self.row_signatures[source_row:source_row + count]
+        if destination_row > source_row:
+            destination_row -= count
+        self.rects[destination_row:destination_row] = moved_rects
+        self.row_signatures[destination_row:destination_row] = moved_signatures
+        self.endMoveRows()
+        self.orderChanged.emit([rect.id for rect in self.rects])
+        return True
+
+
+class RectItemDelegate(QStyledItemDelegate):
+    # paints the thumbnail and the texts of a rect, only for the visible rows
+    def paint(self, painter, option, index):
+        rect = index.model().getRect(index)
+        if not rect:
+            return
+        painter.save()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+            painter.setPen(option.palette.highlightedText().color())
+        else:
+            painter.setPen(option.palette.text().color())
 
-        self.parent = None
-        self.rect_item = rect
+        area = option.rect.adjusted(4, 4, -4, -4)
+        thumbnail = index.data(Qt.ItemDataRole.DecorationRole)
+        if thumbnail:
+            top = area.top() + (area.height() - thumbnail.height()) // 2
+            painter.drawPixmap(area.left(), top, thumbnail)
+        else:
+            painter.drawText(
+                QRect(area.left(), area.top(), LIST_THUMBNAIL_SIZE, area.height()),
+                Qt.AlignmentFlag.AlignCenter, '[]')
+
+        text_area = area.adjusted(LIST_THUMBNAIL_SIZE + 8, 0, 0, 0)
+        line_height = text_area.height() // 2
+        found_text = rect.detected_characters if rect.detected_characters else '...'
+        machine_text = rect.machine_translation if rect.machine_translation else '???'
+        metrics = option.fontMetrics
+        for line_index, line in enumerate([f'Charactes: {found_text}', f'Translation: {machine_text}']):
+            line_rect = QRect(text_area.left(), text_area.top() + line_index * line_height,
+                              text_area.width(), line_height)
+            elided = metrics.elidedText(line, Qt.TextElideMode.ElideRight, line_rect.width())
+            painter.drawText(line_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, elided)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), LIST_ROW_HEIGHT)
 
-        self.rect_main_info = None
-        self.render()
-    
-    def showThisRectDetails(self):
-        if self.parent:
-            self.parent.goToDetails(self.rect_item)
-        
-    
-    def clear(self):
-        if self.rect_main_info:
-            self.base_layout.removeWidget(self.toggle_button)
-            self.base_layout.removeWidget(self.rect_main_info)
-            sip.delete(self.rect_main_info)
-            self.rect_main_info = None
-
-    def render(self):
-        self.clear()
-        self.rect_main_info = QWidget()
-        simple_layout = QVBoxLayout()
-        self.rect_main_info.setLayout(simple_layout)
-
-        text_i_detected = QLabel()
-        text_i_detected.setText(f'Charactes: <span style="font-style: bold;">{self.detail_raw_charactes_found}</span>')
-        simple_layout.addWidget(text_i_detected)
-
-        text_tranlation = QLabel()
-        text_tranlation.setText(f'Translation: <span style="font-style: bold;">{self.detail_proposed_transaltion}</span>')
-        simple_layout.addWidget(text_tranlation)
-
-        self.base_layout.addWidget(self.rect_main_info)
-        self.base_layout.addWidget(self.toggle_button, alignment=Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
 
 class HoverHandler(QObject):
     # Custom signal to emit when the mouse enters or leaves
@@ -163,10 +262,12 @@ class AreaDetails(CollapsibleSection):
         self.tab_rect_details = None
         self.createTabRectDetails()
         self.updateTabPageTranslation()
+        self.createTabSearch()
 
         self.tab_bar = QTabWidget()
         self.tab_bar.addTab(self.tab_list_of_rects, 'List Rects')
         self.tab_bar.addTab(self.tab_rect_details, 'Rect Details')
+        self.tab_bar.addTab(self.tab_search, 'Search')
 
         self.tab_bar.setSizePolicy(
             QSizePolicy.Policy.Expanding,
@@ -186,8 +287,14 @@ class AreaDetails(CollapsibleSection):
         
 
 
-    def clearListRects(self):
-        self.widget_list_details.clear()
+    def setListRects(self, list_of_rects):
+        # only the rows that changed are repainted
+        self.rects_model.setRects(list_of_rects)
+
+    def onRectClicked(self, index):
+        rect = self.rects_model.getRect(index)
+        if rect:
+            self.goToDetails(rect)
 
     def clearRectDetails(self):
         widget = self.tab_rect_details.widget()
@@ -202,38 +309,6 @@ class AreaDetails(CollapsibleSection):
                     sip.delete(child_widget)
             widget.update()
 
-    def addRectsToList(self, list_of_rects):
-        for rect in list_of_rects:
-            widget = QWidget()
-            main_container = QHBoxLayout()
-            main_container.setAlignment(Qt.AlignmentFlag.AlignLeft)
-            main_container.setContentsMargins(0, 0, 0, 0)
-            widget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-            widget.setLayout(main_container)
-
-            # Add a QLabel with the QPixmap to the custom widget
-            pixmap_label = QLabel()
-            if rect.image:
-                scaled_pixmap = rect.image.scaled(64, 64, Qt.AspectRatioMode.KeepAspectRatio)
-                pixmap_label.setPixmap(scaled_pixmap)  # Resize pixmap
-            else:
-                pixmap_label.setText("[]")
-            
-            main_container.addWidget(pixmap_label)
-            main_container.setAlignment(Qt.AlignmentFlag.AlignLeft)
-            
-            rect_item = ListRectItem(rect)
-            rect_item.parent = self
-            main_container.addWidget(rect_item)
-            
-            item = QListWidgetItem()
-            item.setSizeHint(widget.sizeHint())
-            item.setData(0, rect.id)
-            # Set the resized image on the label
-            
-            self.widget_list_details.addItem(item)
-            self.widget_list_details.setItemWidget(item, widget)
-    
     def onRectListOrderChange(self, new_order):
         print('order changed!', new_order )
         self.parent.view.updateOrderRects(new_order)
@@ -249,20 +324,59 @@ class AreaDetails(CollapsibleSection):
             QSizePolicy.Policy.Expanding 
         )
 
-         # Create a widget to hold the content
-        details = QWidget()
-        self.widget_list_details = ReorderableListWidget(details)
+        self.rects_model = RectListModel()
+        self.rects_model.orderChanged.connect(self.onRectListOrderChange)
 
+        self.widget_list_details = QListView()
+        self.widget_list_details.setModel(self.rects_model)
+        self.widget_list_details.setItemDelegate(RectItemDelegate(self.widget_list_details))
+        self.widget_list_details.setUniformItemSizes(True)
+        self.widget_list_details.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.widget_list_details.setDragEnabled(True)  # Allow dragging items
         self.widget_list_details.setAcceptDrops(True)  # Allow dropping items
         self.widget_list_details.setDropIndicatorShown(True)  # Show drop indicator
-        self.widget_list_details.setDragDropMode(QListWidget.DragDropMode.InternalMove) 
+        self.widget_list_details.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.widget_list_details.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.widget_list_details.clicked.connect(self.onRectClicked)
+        self.widget_list_details.setSizePolicy(
+            QSizePolicy.Policy.Expanding,
+            QSizePolicy.Policy.Expanding 
+        )
 
-        self.widget_list_details.orderChanged.connect(self.onRectListOrderChange)
-        # Set the content widget to the scroll area
-        
         self.tab_list_of_rects.setWidget(self.widget_list_details)
     
+    def createTabSearch(self):
+        # search on the text and translations of all the pages
+        self.tab_search = QWidget()
+        layout = QVBoxLayout(self.tab_search)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText('Search text or translation...')
+        self.search_input.textChanged.connect(self.onSearchTextChanged)
+        self.search_results = QListWidget()
+        self.search_results.itemActivated.connect(self.onSearchResultActivated)
+        self.search_results.itemClicked.connect(self.onSearchResultActivated)
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.search_results)
+
+    def showSearch(self):
+        self.tab_bar.setCurrentWidget(self.tab_search)
+        self.search_input.setFocus()
+        self.search_input.selectAll()
+
+    def onSearchTextChanged(self, query):
+        self.search_results.clear()
+        if not query.strip():
+            return
+        results = self.parent.searchText(query)
+        for result in results:
+            item = QListWidgetItem(f'p. {result.page_index + 1}: {result.text}')
+            item.setData(Qt.ItemDataRole.UserRole, (result.page_index, result.rect_id))
+            self.search_results.addItem(item)
+
+    def onSearchResultActivated(self, item):
+        (page_index, rect_id) = item.data(Qt.ItemDataRole.UserRole)
+        self.parent.goToSearchResult(page_index, rect_id)
+
     def on_hover(self, hovered):
         # Slot to handle the hover signal
         if hovered and self.active_rect_details:
@@ -304,9 +418,9 @@ class AreaDetails(CollapsibleSection):
         layout.setSpacing(8)
 
         pixmap_label = QLabel()
-        if rect.image:
-            scaled_pixmap = rect.image.scaled(120, 120, Qt.AspectRatioMode.KeepAspectRatio)
-            pixmap_label.setPixmap(scaled_pixmap)  # Resize pixmap
+        scaled_pixmap = rect.makeThumbnail(120)
+        if scaled_pixmap:
+            pixmap_label.setPixmap(scaled_pixmap)
         else:
             pixmap_label.setText("[]")
         pixmap_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
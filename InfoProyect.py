@@ -0,0 +1,263 @@
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QPixmap
+from PageCache import PageCache, DEFAULT_PAGE_CACHE_BYTES
+from uuid import UUID
+import json
+
+# the grayscale buffers for the ocr use a quarter of the memory of a page
+DEFAULT_PAGE_BUFFER_CACHE_BYTES = 128 * 1024 * 1024
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+
+def parseTextEntry(text_info):
+    # from the json layout of the .gmt files to the one used on memory
+    start = text_info['start']
+    end = text_info['end']
+    return {
+        'initial_pos': QPointF( start['x'], start['y'] ),
+        'end_pos':QPointF( end['x'], end['y'] ),
+        'id': UUID(text_info['id']),
+        'raw_text': text_info.get('raw_text'),
+        'machine_translation': text_info.get('machine_translation')
+    }
+
+
+def textEntryToData(text):
+    start = text['initial_pos']
+    end = text['end_pos']
+    return {
+        'id': f'{text['id']}',
+        'start' : { 'x':int(start.x()), 'y':int(start.y()) },
+        'end' : { 'x':int(end.x()), 'y':int(end.y()) },
+        'raw_text': text['raw_text'],
+        'machine_translation': text['machine_translation']
+    }
+
+
+def makePageState(path, gui_info, texts_data):
+    # what a page has, on the json layout, to compare it between saves
+    texts = { data['id']: data for data in texts_data }
+    return {
+        'path': path,
+        'gui_info': dict(gui_info),
+        'ids': list(texts.keys()),
+        'texts': texts
+    }
+
+
+def getTextDefinition(text):
+    # same x,y,w,h tuple that ImageRect.getDefinition returns
+    start = text['initial_pos']
+    end = text['end_pos']
+    x = int(start.x())
+    y = int(start.y())
+    return (x, y, int(end.x() - x), int(end.y() - y))
+
+
+class InfoProyect():
+    def __init__(self, page_cache_bytes=DEFAULT_PAGE_CACHE_BYTES,
+                 page_buffer_cache_bytes=DEFAULT_PAGE_BUFFER_CACHE_BYTES):
+        self.pages = []
+        # the pages are only decoded when they are needed
+        self.page_cache = PageCache(page_cache_bytes)
+        self.page_buffer_cache = PageCache(page_buffer_cache_bytes)
+        # what each page had on the last save, to only write what changed
+        self.saved_state = {}
+        self.dirty_pages = set()
+        self.needs_full_save = True
+        # when the proyect comes from a .gmtdb, the texts of each
+        # page are read from it the first time they are needed.
+        self.store = None
+    
+    def pushPage(self, path):
+        print(f'push ({path})')
+        self.dirty_pages.add(len(self.pages))
+        self.pages.append(
+            { "path": path,
+              "gui_info": {
+                  "showing_order": False,
+                  "showing_overlay_text": False
+              },
+              "text": []
+            }
+        )
+        return len(self.pages) - 1
+    
+    def toData(self):
+        # a copy of all the proyect on the json layout of the .gmt files
+        clean_data = { 'pages':[] }
+        for page_index, page in enumerate(self.pages):
+            clean_page_data = {
+                'path': page['path'],
+                'gui_info': dict(page['gui_info']),
+                'text': []
+            }
+            for text in self.getListTexts(page_index):
+                clean_page_data['text'].append(textEntryToData(text))
+            clean_data['pages'].append(clean_page_data)
+        return clean_data
+
+    def toString(self):
+        return json.dumps(self.toData(), indent=2, ensure_ascii=False)
+
+    def markDirty(self, page_index):
+        self.dirty_pages.add(page_index)
+
+    def getPageState(self, page_index):
+        page = self.pages[page_index]
+        return makePageState(
+            page['path'], page['gui_info'],
+            [textEntryToData(text) for text in self.getListTexts(page_index)])
+
+    def markAllSaved(self):
+        # the pages not read from the store yet take their saved
+        # state from it when they are read.
+        self.saved_state = { index: self.getPageState(index)
+                             for index, page in enumerate(self.pages)
+                             if page["text"] != None }
+        self.dirty_pages = set()
+        self.needs_full_save = False
+
+    def setStore(self, store):
+        if self.store != None and self.store != store:
+            self.store.close()
+        self.store = store
+
+    def pushLoadedPage(self, path, gui_info, texts_data=None):
+        # a page of a proyect being opened, its texts are kept as they
+        # are on the file (or on the store when texts_data is None)
+        # until the page is needed.
+        self.pages.append({ "path": path, "gui_info": gui_info,
+                            "text": None, "text_data": texts_data })
+        return len(self.pages) - 1
+
+    def loadFromStore(self, store):
+        # only the list of pages, the texts stay on the store for now
+        self.setStore(store)
+        for (path, gui_info) in store.readPageList():
+            self.pushLoadedPage(path, gui_info)
+        return len(self.pages)
+
+    def takeChanges(self):
+        # the journal records of what changed on the dirty pages since the
+        # last save, the cost only depends on how many pages changed.
+        records = []
+        for page_index in sorted(self.dirty_pages):
+            if page_index >= len(self.pages):
+                continue
+            state = self.getPageState(page_index)
+            saved = self.saved_state.get(page_index)
+            if saved == None:
+                records.append({ 'op': 'add_page', 'page': page_index,
+                                 'path': state['path'], 'gui_info': state['gui_info'] })
+                saved = { 'gui_info': state['gui_info'], 'ids': [], 'texts': {} }
+            elif saved['gui_info'] != state['gui_info']:
+                records.append({ 'op': 'gui_info', 'page': page_index, 'gui_info': state['gui_info'] })
+
+            for id in saved['ids']:
+                if not id in state['texts']:
+                    records.append({ 'op': 'remove_text', 'page': page_index, 'id': id })
+            for id, data in state['texts'].items():
+                if saved['texts'].get(id) != data:
+                    records.append({ 'op': 'set_text', 'page': page_index, 'text': data })
+            # the new texts are added at the end, any other order needs a record
+            expected_order = [id for id in saved['ids'] if id in state['texts']]
+            expected_order += [id for id in state['ids'] if not id in saved['texts']]
+            if expected_order != state['ids']:
+                records.append({ 'op': 'order', 'page': page_index, 'ids': state['ids'] })
+
+            self.saved_state[page_index] = state
+        self.dirty_pages = set()
+        return records
+    
+    def setPageGuiInfo(self, page_index, setting, value):
+        #print( f'set gui info of page {page_index} at "{setting}" to {value}' )
+        self.getListTexts(page_index) # to have the saved state before changing it
+        self.pages[page_index]["gui_info"][setting] = value
+        self.dirty_pages.add(page_index)
+    
+    def getPageGuiInfo(self, page_index, setting):
+        value = self.pages[page_index]["gui_info"][setting]
+        #print( f'get gui info of page {page_index} at "{setting}" ({value})' )
+        return value
+    
+    def getPixmap(self, page_index):
+        path = self.pages[page_index]["path"]
+        pixmap = self.page_cache.get(path)
+        if pixmap == None:
+            print(f'decoding page {page_index} ({path})')
+            pixmap = QPixmap(path)
+            self.page_cache.put(path, pixmap)
+        return pixmap
+
+    def findPageBuffer(self, page_index):
+        # the cpu side grayscale page the ocr crops are taken from, or None
+        # when there is none yet, they are made on the worker threads.
+        return self.page_buffer_cache.get(self.pages[page_index]["path"])
+
+    def putPageBuffer(self, path, page_buffer):
+        self.page_buffer_cache.put(path, page_buffer, page_buffer.getBytes())
+
+    def isPageDecoded(self, page_index):
+        return self.pages[page_index]["path"] in self.page_cache
+
+    def putDecodedPage(self, path, pixmap):
+        self.page_cache.put(path, pixmap)
+
+    def setPagesOnScreen(self, list_page_indexes):
+        # the pages on screen are never dropped from the cache
+        paths = [self.pages[index]["path"] for index in list_page_indexes]
+        self.page_cache.setPinned(paths)
+        self.page_buffer_cache.setPinned(paths)
+    
+    def getPath(self, page_index):
+        return self.pages[page_index]["path"]
+    
+    def getListTexts(self, page_index):
+        page = self.pages[page_index]
+        if page["text"] == None:
+            texts_data = page.pop("text_data", None)
+            if texts_data == None:
+                texts_data = self.store.readPageTexts(page_index)
+            page["text"] = [parseTextEntry(text_info) for text_info in texts_data]
+            if not page_index in self.saved_state:
+                self.saved_state[page_index] = makePageState(
+                    page['path'], page['gui_info'], texts_data)
+        return page["text"]
+    
+    def saveTextSelections(self, page_index, list_texts):
+        if self.pages[page_index]["text"] == None:
+            self.getListTexts(page_index)
+        self.pages[page_index]["text"] = list_texts
+        self.dirty_pages.add(page_index)
+
+    def findText(self, page_index, rect_id):
+        if page_index == None or page_index >= len(self.pages):
+            return None
+        for text in self.getListTexts(page_index):
+            if text['id'] == rect_id:
+                return text
+        return None
+    
+    def loadPageData(self, page_index, page):
+        # set the gui info and texts of a page parsed from a .gmt file
+        gui_info = page['gui_info']
+        self.setPageGuiInfo(
+            page_index,
+            "showing_order", gui_info.get('showing_order') )
+        self.setPageGuiInfo(
+            page_index,
+            "showing_overlay_text", gui_info.get('showing_overlay_text') )
+        self.saveTextSelections(
+            page_index,
+            [parseTextEntry(text_info) for text_info in page['text']])
+
+    def clear(self):
+        self.pages = []
+        self.saved_state = {}
+        self.dirty_pages = set()
+        self.needs_full_save = True
+        self.setStore(None)
+        self.page_cache.clear()
+        self.page_buffer_cache.clear()
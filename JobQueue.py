@@ -0,0 +1,196 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from collections import deque
+from BatchOCR import DEFAULT_BATCH_SIZE, groupByAspectRatio, recognizeBatch
+import threading
+
+
+class OCRJob():
+    def __init__(self, page_index, rect_id, page_buffer, definition):
+        self.page_index = page_index
+        self.rect_id = rect_id
+        # the crop is taken on the worker, from the cpu side page
+        self.page_buffer = page_buffer
+        self.definition = definition
+        self.image = None
+        self.cache_key = None
+        self.is_finished = False
+
+
+class TranslationJob():
+    def __init__(self, page_index, rect_id, text, dest):
+        self.page_index = page_index
+        self.rect_id = rect_id
+        self.text = text
+        self.dest = dest
+
+
+class TextJobQueue(QObject):
+    # All the signals carry (page_index, rect_id, result), they are
+    # emited from the worker threads and Qt delivers them queued
+    # on the GUI thread, so the slots can touch widgets safely.
+    ocrFinished = pyqtSignal(object, object, str)
+    translationFinished = pyqtSignal(object, object, str)
+    ocrFailed = pyqtSignal(object, object, str)
+    translationFailed = pyqtSignal(object, object, str)
+
+    def __init__(self, executor, translation_service, ocr_batch_size=DEFAULT_BATCH_SIZE, ocr_cache=None,
+                 translation_service_factory=None):
+        super().__init__()
+        self.executor = executor
+        self.ocr_cache = ocr_cache
+        self.ocr_batch_size = max(1, ocr_batch_size)
+        self.translation_service = translation_service
+        # to create the service (and import all the translation stack)
+        # only when the first translation is asked.
+        self.translation_service_factory = translation_service_factory
+        self.ocr_engine = None
+
+        self.lock = threading.Lock()
+        # the model is not shared between threads, so all the
+        # ocr jobs are drained in order by a single worker.
+        self.pending_ocr = deque()
+        self.is_ocr_worker_running = False
+        self.pending_ocr_ids = set()
+        self.pending_translation_ids = set()
+
+    def isPending(self, rect_id):
+        with self.lock:
+            return (rect_id in self.pending_ocr_ids or
+                    rect_id in self.pending_translation_ids)
+
+    def getNumberPendingOCR(self):
+        # the crops waiting for the model or being recognized
+        with self.lock:
+            return len(self.pending_ocr_ids)
+
+    def submitOCR(self, page_index, rect_id, page_buffer, definition):
+        with self.lock:
+            if rect_id in self.pending_ocr_ids:
+                return False
+            self.pending_ocr.append(OCRJob(page_index, rect_id, page_buffer, definition))
+            self.pending_ocr_ids.add(rect_id)
+            if self.is_ocr_worker_running:
+                return True
+            self.is_ocr_worker_running = True
+        self.executor.submit(self.runOCRJobs)
+        return True
+
+    def submitTranslation(self, page_index, rect_id, text, dest="es"):
+        with self.lock:
+            if rect_id in self.pending_translation_ids:
+                return False
+            self.pending_translation_ids.add(rect_id)
+        job = TranslationJob(page_index, rect_id, text, dest)
+        if self.translation_service == None:
+            self.translation_service = self.translation_service_factory()
+        # the service may answer from its cache or join a request
+        # already running, so no worker is blocked waiting for it.
+        future = self.translation_service.translate(text, dest)
+        future.add_done_callback(lambda future: self.finishTranslationJob(job, future))
+        return True
+
+    def takePendingOCRJobs(self):
+        # everything that was queued while the last batch was running,
+        # no matter from which page it comes.
+        with self.lock:
+            if not self.pending_ocr:
+                self.is_ocr_worker_running = False
+                return []
+            jobs = list(self.pending_ocr)
+            self.pending_ocr.clear()
+            return jobs
+
+    def runOCRJobs(self):
+        jobs = []
+        try:
+            jobs = self.takePendingOCRJobs()
+            while jobs:
+                try:
+                    self.recognizeOCRJobs(jobs)
+                except Exception as e:
+                    self.failOCRJobs(jobs, f'{e}')
+                jobs = self.takePendingOCRJobs()
+        finally:
+            if jobs:
+                # the worker stopped in the middle, the ids must not stay
+                # pending and the next submit has to start a new worker.
+                self.failOCRJobs(jobs, 'the ocr worker stopped')
+                with self.lock:
+                    self.is_ocr_worker_running = bool(self.pending_ocr)
+                if self.is_ocr_worker_running:
+                    self.executor.submit(self.runOCRJobs)
+
+    def recognizeOCRJobs(self, jobs):
+        cropped = []
+        for job in jobs:
+            try:
+                job.image = job.page_buffer.crop(job.definition)
+            except Exception as e:
+                self.failOCRJobs([job], f'{e}')
+                continue
+            finally:
+                job.page_buffer = None
+            cropped.append(job)
+        missing = self.resolveCachedOCRJobs(cropped)
+        batches = groupByAspectRatio(
+            missing, self.ocr_batch_size, get_image=lambda job: job.image)
+        for batch in batches:
+            self.runOCRBatch(batch)
+
+    def failOCRJobs(self, jobs, error):
+        for job in jobs:
+            if job.is_finished:
+                continue
+            self.finishOCRJob(job)
+            self.ocrFailed.emit(job.page_index, job.rect_id, error)
+
+    def resolveCachedOCRJobs(self, jobs):
+        # answer right away the crops that were already recognized,
+        # and return the ones that still need to go to the model.
+        if not self.ocr_cache:
+            return jobs
+        missing = []
+        for job in jobs:
+            try:
+                job.cache_key = self.ocr_cache.makeKey(job.image)
+                text = self.ocr_cache.get(job.cache_key)
+            except Exception as e:
+                # like "database is locked", it is only a miss
+                print(f'OCR cache read failed: {e}')
+                text = None
+            if text == None:
+                missing.append(job)
+                continue
+            self.finishOCRJob(job)
+            self.ocrFinished.emit(job.page_index, job.rect_id, text)
+        return missing
+
+    def runOCRBatch(self, batch):
+        try:
+            texts = recognizeBatch(self.ocr_engine, [job.image for job in batch])
+        except Exception as e:
+            self.failOCRJobs(batch, f'{e}')
+            return
+        for job, text in zip(batch, texts):
+            if self.ocr_cache and job.cache_key:
+                try:
+                    self.ocr_cache.put(job.cache_key, text)
+                except Exception as e:
+                    print(f'OCR cache write failed: {e}')
+            self.finishOCRJob(job)
+            self.ocrFinished.emit(job.page_index, job.rect_id, text)
+
+    def finishOCRJob(self, job):
+        job.is_finished = True
+        with self.lock:
+            self.pending_ocr_ids.discard(job.rect_id)
+
+    def finishTranslationJob(self, job, future):
+        with self.lock:
+            self.pending_translation_ids.discard(job.rect_id)
+        try:
+            text = future.result()
+        except Exception as e:
+            self.translationFailed.emit(job.page_index, job.rect_id, f'{e}')
+            return
+        self.translationFinished.emit(job.page_index, job.rect_id, text)
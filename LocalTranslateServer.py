@@ -0,0 +1,146 @@
+# A stand-in for the translation service that runs on the local machine,
+# it answers with a fake translation and can simulate the latency and
+# the throttling of the real one, so the whole pipeline can be tested
+# (or load-tested) without network.
+#
+#   uv run LocalTranslateServer.py --rate 20 --error-rate 0.05
+#   GOMATA_TRANSLATION_BACKEND=local uv run main_gui.py
+#
+#   uv run LocalTranslateServer.py --load-test 500
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import threading
+import asyncio
+import random
+import json
+import time
+
+
+class ServerLimits():
+    def __init__(self, rate, latency, error_rate):
+        self.rate = rate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.number_requests = 0
+        self.number_throttled = 0
+
+    def takeToken(self):
+        # same token bucket the real services use to throttle clients
+        with self.lock:
+            self.number_requests += 1
+            if self.rate <= 0:
+                return True
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.number_throttled += 1
+                return False
+            self.tokens -= 1
+            return True
+
+
+def fakeTranslation(text, dest):
+    return f'[{dest}] {text}'
+
+
+def createHandler(limits):
+    class TranslateHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/translate':
+                self.sendJson(404, {'error': 'not found'})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length))
+                text = request['text']
+                dest = request.get('dest', 'es')
+            except (ValueError, KeyError):
+                self.sendJson(400, {'error': 'bad request'})
+                return
+
+            if not limits.takeToken():
+                self.sendJson(429, {'error': 'too many requests'}, {'Retry-After': '1'})
+                return
+            if limits.latency > 0:
+                time.sleep(random.uniform(0.5, 1.5) * limits.latency)
+            if random.random() < limits.error_rate:
+                self.sendJson(503, {'error': 'service unavailable'})
+                return
+            self.sendJson(200, {'translation': fakeTranslation(text, dest)})
+
+        def sendJson(self, status, data, headers=None):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # to not flood the terminal on the load tests
+
+    return TranslateHandler
+
+
+def startServer(host, port, limits):
+    server = ThreadingHTTPServer((host, port), createHandler(limits))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+async def loadTest(url, number_requests):
+    from Translation import LocalHTTPBackend, RateLimitedBackend, TranslationError
+    backend = RateLimitedBackend(LocalHTTPBackend(url))
+
+    async def translateOne(index):
+        try:
+            await backend.translate(f'テスト {index}', 'auto', 'es')
+            return True
+        except TranslationError as e:
+            print(f'request {index} lost: {e}')
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(translateOne(i) for i in range(number_requests)))
+    elapsed = time.perf_counter() - start
+    await backend.close()
+    return (sum(results), elapsed, backend.number_retries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in translation server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=10,
+                        help='requests per second before answering 429 (0 = no limit)')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='mean seconds to answer each request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 503')
+    parser.add_argument('--load-test', type=int, default=0, metavar='N',
+                        help='send N translations through the pipeline and exit')
+    args = parser.parse_args()
+
+    limits = ServerLimits(args.rate, args.latency, args.error_rate)
+    server = startServer(args.host, args.port, limits)
+    url = f'http://{args.host}:{args.port}/translate'
+
+    if args.load_test > 0:
+        (translated, elapsed, retries) = asyncio.run(loadTest(url, args.load_test))
+        print(f'{translated}/{args.load_test} translated in {elapsed:.2f}s '
+              f'({translated / elapsed:.1f}/s), {retries} retries, '
+              f'{limits.number_throttled} throttled by the server')
+        server.shutdown()
+    else:
+        print(f'Serving fake translations at {url}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,169 @@
+# Compares the ocr engines (see BatchOCR.OCR_ENGINES) on a fixed set of
+# crops: how many crops per second each one reads and how many characters
+# it gets wrong (character error rate), to know when the faster engines
+# are good enough.
+#
+#   uv run OCRBenchmark.py --from-proyect volumen_01.gmt --crops ./crops
+#   uv run OCRBenchmark.py --crops ./crops --engines torch,onnx,onnx-int8
+#
+# The crops folder has the images and a labels.tsv ("filename<TAB>text"),
+# without labels the text of the torch engine is used as the reference.
+# The speedup is measured against torch, which is always run.
+import argparse
+import json
+import time
+import sys
+import os
+
+from BatchOCR import (DEFAULT_BATCH_SIZE, OCR_ENGINES, groupByAspectRatio,
+    recognizeBatch, getOCREngineName, createOCREngine)
+
+LABELS_FILE = 'labels.tsv'
+CROP_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def getEditDistance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def getCharacterErrorRate(references, texts):
+    errors = sum(getEditDistance(reference, text) for reference, text in zip(references, texts))
+    return errors / max(1, sum(len(reference) for reference in references))
+
+
+def writeCropsFromProyect(proyect_path, crops_dir):
+    # the regions that already have text, the text is taken as the label
+    from PIL import Image
+    from gomata_cli import loadProyect
+    from InfoProyect import getTextDefinition
+    proyect = loadProyect(proyect_path)
+    os.makedirs(crops_dir, exist_ok=True)
+    labels = []
+    for page_index in range(len(proyect.pages)):
+        texts = [text for text in proyect.getListTexts(page_index)
+                 if text['raw_text'] and text['raw_text'] != '[OCR FAILED]']
+        if not texts:
+            continue
+        page_image = Image.open(proyect.getPath(page_index))
+        for text in texts:
+            (x, y, w, h) = getTextDefinition(text)
+            filename = f'{page_index:05d}_{text["id"]}.png'
+            page_image.crop((x, y, x + w, y + h)).convert("L").save(os.path.join(crops_dir, filename))
+            labels.append((filename, text['raw_text']))
+    with open(os.path.join(crops_dir, LABELS_FILE), 'w', encoding="utf-8") as labels_file:
+        for (filename, text) in labels:
+            labels_file.write(f'{filename}\t{text}\n')
+    print(f'{len(labels)} crops written to {crops_dir}')
+
+
+def loadCrops(crops_dir):
+    from PIL import Image
+    labels = {}
+    labels_path = os.path.join(crops_dir, LABELS_FILE)
+    if os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding="utf-8") as labels_file:
+            for line in labels_file:
+                (filename, _, text) = line.rstrip('\n').partition('\t')
+                labels[filename] = text
+    crops = []
+    for filename in sorted(os.listdir(crops_dir)):
+        if filename.lower().endswith(CROP_EXTENSIONS):
+            image = Image.open(os.path.join(crops_dir, filename))
+            image.load()
+            crops.append((filename, image))
+    return (crops, labels)
+
+
+def runEngine(engine_name, crops, batch_size):
+    start = time.perf_counter()
+    engine = createOCREngine(engine_name)
+    load_time = time.perf_counter() - start
+
+    # one batch before measuring, the first runs are always slower
+    recognizeBatch(engine, [image for (_, image) in crops[:batch_size]])
+
+    texts = {}
+    start = time.perf_counter()
+    for batch in groupByAspectRatio(crops, batch_size, get_image=lambda crop: crop[1]):
+        results = recognizeBatch(engine, [image for (_, image) in batch])
+        for (filename, _), text in zip(batch, results):
+            texts[filename] = text
+    elapsed = time.perf_counter() - start
+    return {
+        'engine': engine_name,
+        'load_seconds': load_time,
+        'seconds': elapsed,
+        'crops_per_second': len(crops) / max(elapsed, 1e-9),
+        'texts': texts,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the speed and accuracy of the ocr engines')
+    parser.add_argument('--crops', required=True, help='folder with the crops (and labels.tsv)')
+    parser.add_argument('--from-proyect', default=None,
+                        help='first write the crop set from the recognized regions of a proyect')
+    parser.add_argument('--engines', default=','.join(OCR_ENGINES))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args()
+
+    try:
+        engine_names = [getOCREngineName(name.strip()) for name in args.engines.split(',') if name.strip()]
+    except ValueError as e:
+        parser.error(f'{e}, the engines are: {", ".join(OCR_ENGINES)}')
+    # the speedup is always against the torch engine
+    if not 'torch' in engine_names:
+        print('adding torch as the baseline', file=sys.stderr)
+        engine_names.insert(0, 'torch')
+
+    if args.from_proyect:
+        writeCropsFromProyect(args.from_proyect, args.crops)
+    (crops, labels) = loadCrops(args.crops)
+    if not crops:
+        print(f'No crops found on {args.crops}')
+        sys.exit(1)
+
+    results = []
+    for engine_name in engine_names:
+        print(f'running {engine_name} on {len(crops)} crops...', file=sys.stderr)
+        results.append(runEngine(engine_name, crops, max(1, args.batch_size)))
+
+    filenames = [filename for (filename, _) in crops]
+    baseline = next(result for result in results if result['engine'] == 'torch')
+    if labels:
+        reference_name = LABELS_FILE
+        references = [labels.get(filename, '') for filename in filenames]
+    else:
+        reference_name = baseline['engine']
+        references = [baseline['texts'][filename] for filename in filenames]
+
+    report = []
+    for result in results:
+        texts = [result['texts'][filename] for filename in filenames]
+        report.append({
+            'engine': result['engine'],
+            'load_seconds': round(result['load_seconds'], 3),
+            'crops_per_second': round(result['crops_per_second'], 2),
+            'speedup': round(result['crops_per_second'] / baseline['crops_per_second'], 2),
+            'cer': round(getCharacterErrorRate(references, texts), 4),
+            'exact': round(sum(r == t for r, t in zip(references, texts)) / len(texts), 4),
+        })
+
+    if args.json:
+        print(json.dumps({ 'crops': len(crops), 'batch_size': args.batch_size,
+                           'reference': reference_name, 'engines': report }, ensure_ascii=False))
+        sys.exit(0)
+    print(f'{len(crops)} crops, batch size {args.batch_size}, reference: {reference_name}')
+    print(f'{"engine":>10} {"load":>8} {"crops/s":>9} {"speedup":>8} {"CER":>8} {"exact":>7}')
+    for row in report:
+        print(f'{row["engine"]:>10} {row["load_seconds"]:>7.1f}s {row["crops_per_second"]:>9.2f} '
+              f'{row["speedup"]:>7.2f}x {row["cer"] * 100:>7.2f}% {row["exact"] * 100:>6.1f}%')
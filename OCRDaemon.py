@@ -0,0 +1,295 @@
+# A process that keeps the manga-ocr model loaded and recognizes the
+# crops sent by the gui windows and batch jobs over a unix socket, so the
+# model is loaded once per machine instead of once per window. The crops
+# of all the clients are put together on the same batches.
+#
+#   uv run OCRDaemon.py
+#
+# The gui and gomata_cli.py use it when it is running, and load the model
+# by themselves when it is not.
+import socketserver
+import threading
+import argparse
+import socket
+import struct
+import json
+import time
+import sys
+import os
+
+from BatchOCR import (OCR_MODEL_ID, OCR_ENGINES, DEFAULT_BATCH_SIZE, groupByAspectRatio,
+    recognizeBatch, getOCREngineName, getOCREngineId, createOCREngine)
+
+# how long the server waits for more crops to fill a batch
+DEFAULT_BATCH_WAIT = 0.01
+CONNECT_TIMEOUT = 0.5
+FRAME_HEADER = struct.Struct('>I')
+
+
+def getOCRSocketPath():
+    path = os.environ.get('GOMATA_OCR_SOCKET')
+    if path:
+        return path
+    from Cache import getUserCacheDir
+    base = os.environ.get('XDG_RUNTIME_DIR') or getUserCacheDir()
+    return os.path.join(base, 'gomata-ocr.sock')
+
+
+# every message is a frame, the size in 4 bytes and then the content.
+# A request is a json frame followed by one frame with the L pixels of
+# each crop, the answer is a single json frame.
+def sendFrame(connection, payload):
+    connection.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def receiveExactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('the connection was closed')
+        data.extend(chunk)
+    return bytes(data)
+
+
+def receiveFrame(connection):
+    (size,) = FRAME_HEADER.unpack(receiveExactly(connection, FRAME_HEADER.size))
+    return receiveExactly(connection, size)
+
+
+def sendJson(connection, data):
+    sendFrame(connection, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def receiveJson(connection):
+    return json.loads(receiveFrame(connection).decode('utf-8'))
+
+
+class PendingCrop():
+    def __init__(self, image):
+        self.image = image
+        self.text = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchingRecognizer():
+    # A single thread owns the model, it takes all the crops waiting
+    # (from every client) and runs them as batches.
+    def __init__(self, manga_ocr_instance, batch_size, batch_wait):
+        self.manga_ocr_instance = manga_ocr_instance
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.condition = threading.Condition()
+        self.pending = []
+        self.number_batches = 0
+        self.number_crops = 0
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def recognize(self, images):
+        crops = [PendingCrop(image) for image in images]
+        with self.condition:
+            self.pending.extend(crops)
+            self.condition.notify()
+        for crop in crops:
+            crop.done.wait()
+        errors = [crop.error for crop in crops if crop.error]
+        if errors:
+            raise RuntimeError(errors[0])
+        return [crop.text for crop in crops]
+
+    def takePending(self):
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+        # a short wait, so the requests that arrive together share the batch
+        if self.batch_wait > 0:
+            time.sleep(self.batch_wait)
+        with self.condition:
+            crops = self.pending
+            self.pending = []
+            return crops
+
+    def run(self):
+        while True:
+            crops = self.takePending()
+            for batch in groupByAspectRatio(crops, self.batch_size, get_image=lambda crop: crop.image):
+                try:
+                    texts = recognizeBatch(self.manga_ocr_instance, [crop.image for crop in batch])
+                    for crop, text in zip(batch, texts):
+                        crop.text = text
+                except Exception as e:
+                    for crop in batch:
+                        crop.error = f'{e}'
+                self.number_batches += 1
+                self.number_crops += len(batch)
+                for crop in batch:
+                    crop.done.set()
+
+
+def createHandler(recognizer, engine_id):
+    from PIL import Image
+
+    class OCRRequestHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            # a client keeps the connection open for all its requests
+            while True:
+                try:
+                    request = receiveJson(self.request)
+                    operation = request['op']
+                    # all the frames of the request are read before anything
+                    # is decoded, so an error does not leave pixels unread
+                    frames = []
+                    if operation == 'recognize':
+                        sizes = [(int(width), int(height)) for (width, height) in request['sizes']]
+                        frames = [receiveFrame(self.request) for _ in sizes]
+                except Exception:
+                    # closed, or a request that can not be parsed, after it
+                    # the stream is out of sync, so the connection is closed
+                    return
+                try:
+                    if operation == 'ping':
+                        sendJson(self.request, { 'model': engine_id })
+                    elif operation == 'recognize':
+                        images = [Image.frombytes('L', size, pixels) for size, pixels in zip(sizes, frames)]
+                        sendJson(self.request, { 'texts': recognizer.recognize(images) })
+                    elif operation == 'stats':
+                        sendJson(self.request, { 'batches': recognizer.number_batches,
+                                                 'crops': recognizer.number_crops })
+                    else:
+                        sendJson(self.request, { 'error': f'unknown op {operation}' })
+                except (ConnectionError, OSError):
+                    return
+                except Exception as e:
+                    sendJson(self.request, { 'error': f'{e}' })
+
+    return OCRRequestHandler
+
+
+class OCRDaemonClient():
+    # Looks like an ocr engine for BatchOCR.recognizeBatch, the
+    # recognition happens on the daemon.
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.model_id = None
+
+    def connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(CONNECT_TIMEOUT)
+        try:
+            connection.connect(self.socket_path)
+            sendJson(connection, { 'op': 'ping' })
+            self.model_id = receiveJson(connection)['model']
+        except Exception:
+            connection.close()
+            raise
+        # the recognition may take a while when the daemon is busy
+        connection.settimeout(None)
+        self.connection = connection
+
+    def request(self, images):
+        gray_images = [image if image.mode == "L" else image.convert("L") for image in images]
+        sendJson(self.connection, { 'op': 'recognize',
+                                    'sizes': [list(image.size) for image in gray_images] })
+        for image in gray_images:
+            sendFrame(self.connection, image.tobytes())
+        answer = receiveJson(self.connection)
+        if 'error' in answer:
+            raise RuntimeError(f'OCR daemon: {answer["error"]}')
+        return answer['texts']
+
+    def recognizeBatch(self, images):
+        with self.lock:
+            try:
+                if self.connection == None:
+                    self.connect()
+                return self.request(images)
+            except (ConnectionError, OSError):
+                # the daemon was restarted, try once with a new connection
+                self.close()
+                self.connect()
+                return self.request(images)
+
+    def __call__(self, image):
+        return self.recognizeBatch([image])[0]
+
+    def close(self):
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+
+
+def connectToDaemon(socket_path=None, engine_id=OCR_MODEL_ID):
+    # returns a client when a daemon with the same model and engine is running
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    socket_path = socket_path if socket_path else getOCRSocketPath()
+    if not os.path.exists(socket_path):
+        return None
+    client = OCRDaemonClient(socket_path)
+    try:
+        client.connect()
+    except (ConnectionError, OSError, ValueError, KeyError):
+        return None
+    if client.model_id != engine_id:
+        client.close()
+        return None
+    return client
+
+
+def serve(socket_path, engine_name, batch_size, batch_wait):
+    engine_id = getOCREngineId(engine_name)
+    client = OCRDaemonClient(socket_path)
+    try:
+        client.connect()
+    except (ConnectionRefusedError, FileNotFoundError):
+        # nobody is listening, the socket was left by a daemon that did not close well
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    except Exception as e:
+        # something is there, but it does not answer as a daemon
+        print(f'Can not use {socket_path}, it is in use: {e}')
+        return 1
+    else:
+        client.close()
+        running_engines = [name for name in OCR_ENGINES if getOCREngineId(name) == client.model_id]
+        running_engine = running_engines[0] if running_engines else client.model_id
+        print(f'An OCR daemon with engine {running_engine} is already running on {socket_path}')
+        return 1
+
+    print(f'Loading {OCR_MODEL_ID} ({engine_name})...')
+    recognizer = BatchingRecognizer(createOCREngine(engine_name), batch_size, batch_wait)
+
+    # the socket is made only for the user that runs it, the umask is
+    # set before the bind so it is never open to others, not even a moment
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(socket_path, createHandler(recognizer, engine_id))
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+    print(f'Serving OCR on {socket_path}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the ocr model loaded for all the gomata windows')
+    parser.add_argument('--socket', default=None, help='path of the unix socket')
+    parser.add_argument('--engine', default=None, help='ocr engine (torch, onnx or onnx-int8)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--batch-wait', type=float, default=DEFAULT_BATCH_WAIT,
+                        help='seconds to wait for more crops before running a batch')
+    args = parser.parse_args()
+    sys.exit(serve(args.socket if args.socket else getOCRSocketPath(),
+                   getOCREngineName(args.engine), max(1, args.batch_size), args.batch_wait))
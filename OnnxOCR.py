@@ -0,0 +1,301 @@
+# manga-ocr running on ONNX Runtime instead of PyTorch, faster on the
+# machines without gpu. The model is exported once to the user cache
+# (this part needs torch), optionally with the weights quantized to int8,
+# and then only onnxruntime, numpy and the tokenizer are needed.
+#
+#   uv run OnnxOCR.py --export
+#   uv run OnnxOCR.py --export --int8
+#   GOMATA_OCR_ENGINE=onnx-int8 uv run main_gui.py
+#
+# onnxruntime and onnx are not part of the default dependencies:
+#   uv pip install onnxruntime onnx
+import argparse
+import shutil
+import json
+import sys
+import os
+
+from BatchOCR import OCR_MODEL_ID, MAX_TEXT_LENGTH
+
+ENCODER_FILE = 'encoder.onnx'
+DECODER_INIT_FILE = 'decoder_init.onnx'
+DECODER_WITH_PAST_FILE = 'decoder_with_past.onnx'
+ENGINE_CONFIG_FILE = 'engine_config.json'
+ONNX_OPSET = 17
+
+
+def getOnnxModelDir(quantized=False):
+    from Cache import getUserCacheDir
+    name = OCR_MODEL_ID.replace('/', '--') + ('-int8' if quantized else '')
+    return os.path.join(getUserCacheDir(), 'onnx', name)
+
+
+def isModelExported(model_dir):
+    return os.path.exists(os.path.join(model_dir, ENGINE_CONFIG_FILE))
+
+
+def getTemporalModelDir(model_dir):
+    # next to the final one, so it can be renamed into place
+    return f'{model_dir}.tmp-{os.getpid()}'
+
+
+def publishModelDir(temporal_dir, model_dir, replace=False):
+    # the model appears complete or not at all, when other process
+    # exported it at the same time the first one to finish is kept.
+    if os.path.exists(model_dir) and (replace or not isModelExported(model_dir)):
+        # an old model, or one left by an export from before that did not finish
+        old_dir = getTemporalModelDir(model_dir) + '-old'
+        os.rename(model_dir, old_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    try:
+        os.rename(temporal_dir, model_dir)
+    except OSError:
+        shutil.rmtree(temporal_dir, ignore_errors=True)
+        if not isModelExported(model_dir):
+            raise
+
+
+def exportOnnxModel(model_dir, replace=False):
+    import torch
+    from manga_ocr import MangaOcr
+
+    manga_ocr_instance = MangaOcr(OCR_MODEL_ID, force_cpu=True)
+    model = manga_ocr_instance.model.eval()
+    final_dir = model_dir
+    model_dir = getTemporalModelDir(final_dir)
+    shutil.rmtree(model_dir, ignore_errors=True)
+    os.makedirs(model_dir)
+
+    class EncoderWrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = model.encoder
+            # only there when the encoder and decoder sizes differ
+            self.projection = getattr(model, 'enc_to_dec_proj', None)
+
+        def forward(self, pixel_values):
+            hidden = self.encoder(pixel_values=pixel_values).last_hidden_state
+            if self.projection != None:
+                hidden = self.projection(hidden)
+            return hidden
+
+    def toLegacyCache(past_key_values):
+        if hasattr(past_key_values, 'to_legacy_cache'):
+            return past_key_values.to_legacy_cache()
+        return past_key_values
+
+    def fromLegacyCache(past_key_values):
+        try:
+            from transformers.cache_utils import EncoderDecoderCache
+        except ImportError:
+            return past_key_values
+        return EncoderDecoderCache.from_legacy_cache(past_key_values)
+
+    class DecoderWrapper(torch.nn.Module):
+        # the cache goes in and out as a flat list of tensors, per layer
+        # the self attention key and value and the cross attention ones.
+        def __init__(self, number_layers):
+            super().__init__()
+            self.decoder = model.decoder
+            self.number_layers = number_layers
+
+        def forward(self, input_ids, encoder_hidden_states, *past_flat):
+            past_key_values = None
+            if past_flat:
+                size = len(past_flat) // self.number_layers
+                past_key_values = fromLegacyCache(tuple(
+                    tuple(past_flat[layer * size:(layer + 1) * size])
+                    for layer in range(self.number_layers)))
+            output = self.decoder(
+                input_ids=input_ids,
+                encoder_hidden_states=encoder_hidden_states,
+                past_key_values=past_key_values,
+                use_cache=True,
+                return_dict=True)
+            present = toLegacyCache(output.past_key_values)
+            return (output.logits,) + tuple(tensor for layer in present for tensor in layer)
+
+    number_layers = model.decoder.config.num_hidden_layers
+    start_token = model.config.decoder_start_token_id
+    image_size = model.config.encoder.image_size
+    pixel_values = torch.zeros(1, 3, image_size, image_size)
+
+    with torch.no_grad():
+        encoder = EncoderWrapper().eval()
+        torch.onnx.export(
+            encoder, (pixel_values,), os.path.join(model_dir, ENCODER_FILE),
+            input_names=['pixel_values'], output_names=['encoder_hidden_states'],
+            dynamic_axes={ 'pixel_values': {0: 'batch'}, 'encoder_hidden_states': {0: 'batch'} },
+            opset_version=ONNX_OPSET)
+
+        decoder = DecoderWrapper(number_layers).eval()
+        encoder_hidden_states = encoder(pixel_values)
+        input_ids = torch.full((1, 1), start_token, dtype=torch.long)
+        outputs = decoder(input_ids, encoder_hidden_states)
+        number_past = len(outputs) - 1
+        past_names = [f'past_{i}' for i in range(number_past)]
+        present_names = [f'present_{i}' for i in range(number_past)]
+
+        torch.onnx.export(
+            decoder, (input_ids, encoder_hidden_states), os.path.join(model_dir, DECODER_INIT_FILE),
+            input_names=['input_ids', 'encoder_hidden_states'],
+            output_names=['logits'] + present_names,
+            dynamic_axes={ 'input_ids': {0: 'batch'}, 'encoder_hidden_states': {0: 'batch'},
+                           'logits': {0: 'batch'},
+                           **{ name: {0: 'batch', 2: 'sequence'} for name in present_names } },
+            opset_version=ONNX_OPSET)
+
+        past_flat = outputs[1:]
+        next_ids = torch.full((1, 1), start_token, dtype=torch.long)
+        torch.onnx.export(
+            decoder, (next_ids, encoder_hidden_states, *past_flat),
+            os.path.join(model_dir, DECODER_WITH_PAST_FILE),
+            input_names=['input_ids', 'encoder_hidden_states'] + past_names,
+            output_names=['logits'] + present_names,
+            dynamic_axes={ 'input_ids': {0: 'batch'}, 'encoder_hidden_states': {0: 'batch'},
+                           'logits': {0: 'batch'},
+                           **{ name: {0: 'batch', 2: 'past_sequence'} for name in past_names },
+                           **{ name: {0: 'batch', 2: 'sequence'} for name in present_names } },
+            opset_version=ONNX_OPSET)
+
+    # the runtime takes the tokenizer and the preprocessing from here
+    manga_ocr_instance.processor.save_pretrained(model_dir)
+    manga_ocr_instance.tokenizer.save_pretrained(model_dir)
+    engine_config = {
+        'model_id': OCR_MODEL_ID,
+        'decoder_start_token_id': start_token,
+        'eos_token_id': model.config.eos_token_id if model.config.eos_token_id != None
+                        else manga_ocr_instance.tokenizer.sep_token_id,
+        'pad_token_id': model.config.pad_token_id if model.config.pad_token_id != None
+                        else manga_ocr_instance.tokenizer.pad_token_id,
+        'number_past': number_past,
+        'quantized': False,
+    }
+    with open(os.path.join(model_dir, ENGINE_CONFIG_FILE), 'w', encoding="utf-8") as config_file:
+        json.dump(engine_config, config_file, indent=2)
+    publishModelDir(model_dir, final_dir, replace)
+    print(f'ONNX model exported to {final_dir}')
+
+
+def quantizeOnnxModel(model_dir, quantized_dir, replace=False):
+    # dynamic quantization, the weights are stored as int8 and the
+    # activations are quantized on the fly, no calibration set needed.
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    final_dir = quantized_dir
+    quantized_dir = getTemporalModelDir(final_dir)
+    shutil.rmtree(quantized_dir, ignore_errors=True)
+    os.makedirs(quantized_dir)
+    for filename in os.listdir(model_dir):
+        source = os.path.join(model_dir, filename)
+        if filename.endswith('.onnx'):
+            quantize_dynamic(source, os.path.join(quantized_dir, filename),
+                             weight_type=QuantType.QInt8)
+        elif filename != ENGINE_CONFIG_FILE:
+            shutil.copy(source, quantized_dir)
+    with open(os.path.join(model_dir, ENGINE_CONFIG_FILE), 'r', encoding="utf-8") as config_file:
+        engine_config = json.load(config_file)
+    engine_config['quantized'] = True
+    with open(os.path.join(quantized_dir, ENGINE_CONFIG_FILE), 'w', encoding="utf-8") as config_file:
+        json.dump(engine_config, config_file, indent=2)
+    publishModelDir(quantized_dir, final_dir, replace)
+    print(f'int8 ONNX model written to {final_dir}')
+
+
+def prepareOnnxModel(quantized=False):
+    # exports (and quantizes) the model the first time it is used
+    model_dir = getOnnxModelDir(False)
+    if not isModelExported(model_dir):
+        exportOnnxModel(model_dir)
+    if not quantized:
+        return model_dir
+    quantized_dir = getOnnxModelDir(True)
+    if not isModelExported(quantized_dir):
+        quantizeOnnxModel(model_dir, quantized_dir)
+    return quantized_dir
+
+
+class OnnxOCREngine():
+    # Same interface than MangaOcr (called with a PIL image), plus the
+    # recognizeBatch that BatchOCR.recognizeBatch uses.
+    def __init__(self, model_dir, number_threads=None):
+        import onnxruntime
+        from transformers import AutoTokenizer, ViTImageProcessor
+
+        with open(os.path.join(model_dir, ENGINE_CONFIG_FILE), 'r', encoding="utf-8") as config_file:
+            self.config = json.load(config_file)
+        self.model_dir = model_dir
+        self.processor = ViTImageProcessor.from_pretrained(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if number_threads:
+            options.intra_op_num_threads = number_threads
+        providers = ['CPUExecutionProvider']
+        def createSession(filename):
+            return onnxruntime.InferenceSession(
+                os.path.join(model_dir, filename), options, providers=providers)
+        self.encoder = createSession(ENCODER_FILE)
+        self.decoder_init = createSession(DECODER_INIT_FILE)
+        self.decoder_with_past = createSession(DECODER_WITH_PAST_FILE)
+        self.number_past = self.config['number_past']
+
+    def recognizeBatch(self, images, max_length=MAX_TEXT_LENGTH):
+        import numpy
+        from manga_ocr.ocr import post_process
+
+        # same preprocessing that MangaOcr.__call__ does per image
+        images = [(image if image.mode == "L" else image.convert("L")).convert("RGB")
+                  for image in images]
+        pixel_values = self.processor(images, return_tensors="np").pixel_values.astype(numpy.float32)
+        # the encoder runs once, its output is used on every step
+        (encoder_hidden_states,) = self.encoder.run(None, { 'pixel_values': pixel_values })
+
+        batch_size = len(images)
+        eos_token = self.config['eos_token_id']
+        pad_token = self.config['pad_token_id']
+        input_ids = numpy.full((batch_size, 1), self.config['decoder_start_token_id'], dtype=numpy.int64)
+        outputs = self.decoder_init.run(None, {
+            'input_ids': input_ids,
+            'encoder_hidden_states': encoder_hidden_states })
+
+        # greedy decoding, with the cache only the new token goes in each step
+        tokens = []
+        finished = numpy.zeros(batch_size, dtype=bool)
+        for step in range(max_length - 1):
+            next_tokens = outputs[0][:, -1, :].argmax(axis=-1)
+            next_tokens = numpy.where(finished, pad_token, next_tokens)
+            tokens.append(next_tokens)
+            finished |= next_tokens == eos_token
+            if finished.all():
+                break
+            feed = {
+                'input_ids': next_tokens[:, None].astype(numpy.int64),
+                'encoder_hidden_states': encoder_hidden_states }
+            for index in range(self.number_past):
+                feed[f'past_{index}'] = outputs[1 + index]
+            outputs = self.decoder_with_past.run(None, feed)
+
+        sequences = numpy.stack(tokens, axis=1) if tokens else numpy.zeros((batch_size, 0), dtype=numpy.int64)
+        texts = self.tokenizer.batch_decode(sequences, skip_special_tokens=True)
+        return [post_process(text) for text in texts]
+
+    def __call__(self, image):
+        return self.recognizeBatch([image])[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export manga-ocr to ONNX')
+    parser.add_argument('--export', action='store_true', help='export the model (again)')
+    parser.add_argument('--int8', action='store_true', help='also write the int8 quantized model')
+    args = parser.parse_args()
+
+    if args.export:
+        exportOnnxModel(getOnnxModelDir(False), replace=True)
+    if args.int8:
+        if not isModelExported(getOnnxModelDir(False)):
+            exportOnnxModel(getOnnxModelDir(False))
+        quantizeOnnxModel(getOnnxModelDir(False), getOnnxModelDir(True), replace=True)
+    if not (args.export or args.int8):
+        parser.print_help()
+    sys.exit(0)
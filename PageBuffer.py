@@ -0,0 +1,55 @@
+from PyQt6.QtGui import QImage
+
+
+class PageBuffer():
+    # Grayscale copy of a page kept on the cpu side, the crops for the ocr
+    # are taken from it. Unlike a QPixmap it can be read from the worker
+    # threads, and each crop costs a single copy of only its own pixels.
+    def __init__(self, image):
+        # Pillow is imported with the first page, not when the gui starts
+        from PIL import Image
+        rgb_image = image.convertToFormat(QImage.Format.Format_RGB888)
+        self.width = rgb_image.width()
+        self.height = rgb_image.height()
+        bits = rgb_image.constBits()
+        bits.setsize(rgb_image.sizeInBytes())
+        # the gray conversion is done by Pillow and not by Qt (other
+        # weights), so the crops are the same that gomata_cli.py and the
+        # ocr daemon client make, and share the keys of the ocr cache.
+        gray = Image.frombuffer(
+            "RGB",
+            (self.width, self.height),
+            bits,
+            "raw",
+            "RGB",
+            rgb_image.bytesPerLine(),
+            1
+        ).convert("L")
+        self.pixels = gray.tobytes()
+        # a view over self.pixels (that is why they are kept), rows
+        # without padding, so numpy can use the same memory.
+        self.view = Image.frombuffer(
+            "L",
+            (self.width, self.height),
+            self.pixels,
+            "raw",
+            "L",
+            0,
+            1
+        )
+
+    def getBytes(self):
+        return len(self.pixels)
+
+    def getArray(self):
+        # a numpy view over the same memory, nothing is copied
+        import numpy
+        return numpy.frombuffer(self.pixels, dtype=numpy.uint8).reshape(self.height, self.width)
+
+    def crop(self, definition):
+        (x, y, w, h) = definition
+        left = max(0, min(self.width, x))
+        top = max(0, min(self.height, y))
+        right = max(left + 1, min(self.width, x + w))
+        bottom = max(top + 1, min(self.height, y + h))
+        return self.view.crop((left, top, right, bottom))
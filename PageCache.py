@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+# memory used by the decoded pages before the old ones are dropped
+DEFAULT_PAGE_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def getPixmapBytes(pixmap):
+    # also works for a QImage
+    return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+
+class PageCache():
+    # Least recently used cache of decoded pages (or of anything that can
+    # tell its size in bytes), bounded by the memory
+    # they use, the pages pinned (the ones on screen) are never dropped.
+    def __init__(self, max_bytes=DEFAULT_PAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()
+        self.total_bytes = 0
+        self.pinned = set()
+
+    def get(self, key):
+        entry = self.pages.get(key)
+        if entry == None:
+            return None
+        self.pages.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, pixmap, cost=None):
+        self.remove(key)
+        cost = cost if cost != None else getPixmapBytes(pixmap)
+        self.pages[key] = (pixmap, cost)
+        self.total_bytes += cost
+        self.evict()
+
+    def remove(self, key):
+        entry = self.pages.pop(key, None)
+        if entry != None:
+            self.total_bytes -= entry[1]
+
+    def setPinned(self, keys):
+        self.pinned = set(keys)
+        self.evict()
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in list(self.pages.keys()):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in self.pinned:
+                continue
+            print(f'page cache: dropping {key}')
+            self.remove(key)
+
+    def __contains__(self, key):
+        return key in self.pages
+
+    def clear(self):
+        self.pages = OrderedDict()
+        self.total_bytes = 0
+        self.pinned = set()
@@ -0,0 +1,97 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader
+from concurrent.futures import ThreadPoolExecutor
+from PageBuffer import PageBuffer
+
+# how many pages before and after the one on screen are decoded
+PREFETCH_PAGES = 2
+PREFETCH_WORKERS = 2
+
+
+def decodePage(path):
+    # QImage (unlike QPixmap) can be made outside of the gui thread
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    return reader.read()
+
+
+class PagePrefetcher(QObject):
+    # Decodes on background the pages around the one on screen, so
+    # moving page by page does not have to wait for the decoding.
+    # emits (path, decoded image, PageBuffer for the ocr), on the gui thread.
+    pageDecoded = pyqtSignal(str, QImage, object)
+
+    def __init__(self, number_pages=PREFETCH_PAGES):
+        super().__init__()
+        self.number_pages = number_pages
+        self.executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+        self.pending = {}
+        self.wanted_paths = set()
+
+    def getWindow(self, index, number_total_pages):
+        # the next pages go first, then the previous ones
+        window = []
+        for distance in range(1, self.number_pages + 1):
+            for page_index in (index + distance, index - distance):
+                if page_index >= 0 and page_index < number_total_pages:
+                    window.append(page_index)
+        return window
+
+    def prefetchAround(self, index, proyect):
+        window = self.getWindow(index, len(proyect.pages))
+        self.wanted_paths = set(proyect.getPath(page_index) for page_index in window)
+
+        # after a jump, what was asked for the old position is not needed
+        for path in list(self.pending.keys()):
+            if not path in self.wanted_paths:
+                if self.pending[path].cancel():
+                    del self.pending[path]
+
+        for page_index in window:
+            path = proyect.getPath(page_index)
+            if path in self.pending or proyect.isPageDecoded(page_index):
+                continue
+            future = self.executor.submit(decodePage, path)
+            self.pending[path] = future
+            future.add_done_callback(lambda future, path=path: self.onDecoded(path, future))
+
+    def onDecoded(self, path, future):
+        # runs on the worker thread, the signal takes it to the gui thread
+        if future.cancelled():
+            return
+        try:
+            image = future.result()
+        except Exception as e:
+            print(f'Failed to prefetch {path}: {e}')
+            return
+        if not image.isNull():
+            # the ocr buffer can be made here too, out of the gui thread
+            self.pageDecoded.emit(path, image, PageBuffer(image))
+
+    def takeFinished(self, path):
+        # called on the gui thread, after the page was put on the cache
+        future = self.pending.get(path)
+        if future and future.done():
+            del self.pending[path]
+
+    def waitFor(self, path):
+        # if the page asked to be shown is already being decoded,
+        # waiting for it is faster than starting again.
+        future = self.pending.pop(path, None)
+        if not future or future.cancel():
+            return None
+        try:
+            image = future.result()
+        except Exception:
+            return None
+        return None if image.isNull() else image
+
+    def cancelAll(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+        self.wanted_paths = set()
+
+    def shutdown(self):
+        self.cancelAll()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,139 @@
+# Append only journal of the changes to a proyect, saved next to the
+# .gmt file. Saving only writes what changed since the last time, and
+# from time to time the journal is compacted into the .gmt file.
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+JOURNAL_EXTENSION = '.journal'
+
+
+def getJournalPath(gmt_path):
+    return f'{gmt_path}{JOURNAL_EXTENSION}'
+
+
+def writeFileAtomically(path, content):
+    # a crash in the middle leaves the old file, never half of the new one
+    temporal_path = f'{path}.tmp'
+    with open(temporal_path, 'w', encoding="utf-8") as output_file:
+        output_file.write(content)
+        output_file.flush()
+        os.fsync(output_file.fileno())
+    os.replace(temporal_path, path)
+
+
+def applyRecord(parsed, record):
+    # applies a record of the journal over the json layout of a .gmt file
+    pages = parsed['pages']
+    operation = record['op']
+    index = record['page']
+    if operation == 'add_page':
+        while len(pages) <= index:
+            pages.append({ 'path': None, 'gui_info': {}, 'text': [] })
+        pages[index]['path'] = record['path']
+        pages[index]['gui_info'] = record['gui_info']
+        return
+
+    page = pages[index]
+    if operation == 'gui_info':
+        page['gui_info'] = record['gui_info']
+    elif operation == 'set_text':
+        text = record['text']
+        for position, old_text in enumerate(page['text']):
+            if old_text['id'] == text['id']:
+                page['text'][position] = text
+                return
+        page['text'].append(text)
+    elif operation == 'remove_text':
+        page['text'] = [text for text in page['text'] if text['id'] != record['id']]
+    elif operation == 'order':
+        order = { id: position for position, id in enumerate(record['ids']) }
+        page['text'].sort(key=lambda text: order.get(text['id'], len(order)))
+
+
+def replayJournal(parsed, gmt_path):
+    # returns how many records were applied over parsed
+    journal_path = getJournalPath(gmt_path)
+    if not os.path.exists(journal_path):
+        return 0
+    number_records = 0
+    with open(journal_path, 'r', encoding="utf-8") as journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line of a crash in the middle of a write
+                print(f'journal: ignoring broken record on {journal_path}')
+                break
+            applyRecord(parsed, record)
+            number_records += 1
+    print(f'journal: {number_records} changes recovered from {journal_path}')
+    return number_records
+
+
+def loadGmt(gmt_path):
+    # the parsed .gmt with the changes of its journal, which is folded
+    # into the file, so the next reader does not apply it again over
+    # whatever gets written to the .gmt from now on.
+    with open(gmt_path, 'r', encoding="utf-8") as content_file:
+        parsed = json.loads(content_file.read())
+    if replayJournal(parsed, gmt_path) > 0:
+        writeFileAtomically(gmt_path, json.dumps(parsed, indent=2, ensure_ascii=False))
+    journal_path = getJournalPath(gmt_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    return parsed
+
+
+class ProyectJournal():
+    def __init__(self, gmt_path, number_records=0):
+        self.gmt_path = gmt_path
+        self.journal_path = getJournalPath(gmt_path)
+        self.number_records = number_records
+        # a single writer, so the appends and compactions keep their order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def append(self, records):
+        if not records:
+            return
+        self.number_records += len(records)
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self.executor.submit(self.writeRecords, lines)
+
+    def writeRecords(self, lines):
+        try:
+            with open(self.journal_path, 'a', encoding="utf-8") as journal_file:
+                journal_file.write(lines)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        except Exception as e:
+            print(f'journal: failed to write to {self.journal_path}: {e}')
+
+    def compact(self, data):
+        # data is a snapshot of all the proyect (InfoProyect.toData)
+        self.number_records = 0
+        return self.executor.submit(self.writeCompacted, data)
+
+    def writeCompacted(self, data):
+        try:
+            writeFileAtomically(
+                self.gmt_path, json.dumps(data, indent=2, ensure_ascii=False))
+        except Exception as e:
+            print(f'journal: failed to compact {self.gmt_path}: {e}')
+            return False
+        # everything on the journal is on the .gmt now
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        print(f'journal: compacted into {self.gmt_path}')
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        # the records not compacted yet go to the .gmt, so the file is
+        # complete for whoever opens it next
+        if os.path.exists(self.journal_path):
+            try:
+                loadGmt(self.gmt_path)
+                print(f'journal: compacted into {self.gmt_path}')
+            except Exception as e:
+                print(f'journal: failed to compact {self.gmt_path}: {e}')
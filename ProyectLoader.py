@@ -0,0 +1,141 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from concurrent.futures import ThreadPoolExecutor
+from ProyectJournal import replayJournal, getJournalPath
+from ProyectStore import isStorePath
+from itertools import islice
+import threading
+import json
+import re
+import os
+
+# after the first page, the rest arrive to the gui on groups of this size
+PAGES_PER_CHUNK = 64
+SPACES = re.compile(r'[ \t\n\r]*')
+
+
+def skipToken(content, position, token):
+    position = SPACES.match(content, position).end()
+    if not content.startswith(token, position):
+        raise ValueError(f'"{token}" expected at char {position}')
+    return SPACES.match(content, position + len(token)).end()
+
+
+def iterGmtPages(content):
+    # the pages of a .gmt decoded one by one, so the first page is
+    # ready without decoding the texts of all the others before.
+    decoder = json.JSONDecoder()
+    has_pages = False
+    position = skipToken(content, 0, '{')
+    while True:
+        (key, position) = decoder.raw_decode(content, position)
+        position = skipToken(content, position, ':')
+        if key != 'pages':
+            (_, position) = decoder.raw_decode(content, position)
+        else:
+            has_pages = True
+            position = skipToken(content, position, '[')
+            if content.startswith(']', position):
+                position = skipToken(content, position, ']')
+            else:
+                while True:
+                    (page, position) = decoder.raw_decode(content, position)
+                    yield page
+                    position = SPACES.match(content, position).end()
+                    if content.startswith(']', position):
+                        position = skipToken(content, position, ']')
+                        break
+                    position = skipToken(content, position, ',')
+        position = SPACES.match(content, position).end()
+        if content.startswith('}', position):
+            break
+        position = skipToken(content, position, ',')
+    if not has_pages:
+        raise KeyError('pages')
+
+
+class ProyectLoader(QObject):
+    # Reads the list of pages of a proyect on background, the first page
+    # is sent alone so it can be shown right away, and the rest arrive
+    # by chunks. The texts are sent as they are on the file, they are
+    # only parsed when their page is needed (InfoProyect.getListTexts).
+    # pagesLoaded emits (generation, first_index, pages), where every
+    # page is a tuple (path, gui_info, texts_data or None for stores)
+    # loadFinished emits (generation, number of changes recovered)
+    pagesLoaded = pyqtSignal(int, int, object)
+    loadFinished = pyqtSignal(int, int)
+    loadFailed = pyqtSignal(int, str)
+
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.generation = 0
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+        return self.generation
+
+    def isCurrent(self, generation):
+        with self.lock:
+            return generation == self.generation
+
+    def load(self, filename, store=None, search_index=None):
+        # a store is opened by the caller, as the texts are read from it later
+        generation = self.cancel()
+        self.executor.submit(self.runLoad, generation, filename, store, search_index)
+        return generation
+
+    def indexPages(self, generation, search_index, store, first_index, pages):
+        # the texts are indexed here, on background, even for the
+        # pages of a store that are not read until they are opened.
+        for offset, (path, gui_info, texts_data) in enumerate(pages):
+            if not self.isCurrent(generation):
+                return
+            if texts_data == None:
+                texts_data = store.readPageTexts(first_index + offset)
+            search_index.indexPage(first_index + offset, texts_data)
+
+    def readPages(self, filename, store):
+        # returns (number of changes recovered, iterator over the pages)
+        if isStorePath(filename):
+            return (0, iter([(path, gui_info, None) for (path, gui_info) in store.readPageList()]))
+        with open(filename, 'r', encoding="utf-8") as content_file:
+            content = content_file.read()
+        if not os.path.exists(getJournalPath(filename)):
+            # the usual case, the pages are decoded while they are sent
+            return (0, ((page['path'], page['gui_info'], page['text'])
+                        for page in iterGmtPages(content)))
+        # the changes that were not compacted yet, left by a crash, they
+        # can touch any page so all the file is parsed before applying them
+        parsed = json.loads(content)
+        number_recovered = replayJournal(parsed, filename)
+        return (number_recovered, iter([(page['path'], page['gui_info'], page['text'])
+                                        for page in parsed['pages']]))
+
+    def runLoad(self, generation, filename, store, search_index):
+        try:
+            (number_recovered, pages) = self.readPages(filename, store)
+            chunk_start = 0
+            chunk_size = 1
+            while True:
+                if not self.isCurrent(generation):
+                    return # another proyect was opened meanwhile
+                chunk = list(islice(pages, chunk_size))
+                if not chunk:
+                    break
+                # indexed before the gui gets them, so the results that
+                # arrive later for these pages are not overwritten.
+                if search_index != None:
+                    self.indexPages(generation, search_index, store, chunk_start, chunk)
+                self.pagesLoaded.emit(generation, chunk_start, chunk)
+                chunk_start += len(chunk)
+                chunk_size = PAGES_PER_CHUNK
+        except Exception as e:
+            self.loadFailed.emit(generation, f'{e}')
+            return
+        self.loadFinished.emit(generation, number_recovered)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
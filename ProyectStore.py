@@ -0,0 +1,217 @@
+# Proyect container on a SQLite database (.gmtdb), made for the big
+# proyects (whole series, thousands of pages), every page and its texts
+# can be read alone, so opening one does not parse all of it. It keeps
+# the same data that the .gmt json, and can be converted both ways.
+#
+#   uv run ProyectStore.py import volume_01.gmt volume_01.gmtdb
+#   uv run ProyectStore.py export volume_01.gmtdb volume_01.gmt
+import threading
+import argparse
+import sqlite3
+import json
+import sys
+
+from ProyectJournal import loadGmt, writeFileAtomically
+
+STORE_EXTENSION = '.gmtdb'
+STORE_FORMAT_VERSION = '1'
+
+
+def isStorePath(path):
+    return path.lower().endswith(STORE_EXTENSION)
+
+
+def textRowToData(row):
+    (id, start_x, start_y, end_x, end_y, raw_text, machine_translation) = row
+    return {
+        'id': id,
+        'start': { 'x': start_x, 'y': start_y },
+        'end': { 'x': end_x, 'y': end_y },
+        'raw_text': raw_text,
+        'machine_translation': machine_translation
+    }
+
+
+def textDataToRow(page_index, position, text):
+    return (page_index, position, text['id'],
+            text['start']['x'], text['start']['y'],
+            text['end']['x'], text['end']['y'],
+            text.get('raw_text'), text.get('machine_translation'))
+
+
+class ProyectStore():
+    def __init__(self, path):
+        self.path = path
+        # read from the gui thread and from the loaders on background
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # with the wal a crash in the middle of a save loses only that save
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL)""")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                page_index INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                gui_info TEXT NOT NULL)""")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS texts (
+                page_index INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                id TEXT NOT NULL,
+                start_x INTEGER NOT NULL,
+                start_y INTEGER NOT NULL,
+                end_x INTEGER NOT NULL,
+                end_y INTEGER NOT NULL,
+                raw_text TEXT,
+                machine_translation TEXT,
+                PRIMARY KEY (page_index, id))""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS texts_page_position ON texts (page_index, position)")
+        self.connection.execute(
+            "INSERT OR IGNORE INTO metadata (key, value) VALUES ('format_version', ?)",
+            (STORE_FORMAT_VERSION,))
+        self.connection.commit()
+
+    def getNumberPages(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def readPageList(self):
+        # only the path and gui info of every page, without the texts
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, gui_info FROM pages ORDER BY page_index").fetchall()
+        return [(path, json.loads(gui_info)) for (path, gui_info) in rows]
+
+    def readPageTexts(self, page_index):
+        with self.lock:
+            rows = self.connection.execute(
+                """SELECT id, start_x, start_y, end_x, end_y, raw_text, machine_translation
+                FROM texts WHERE page_index = ? ORDER BY position""",
+                (page_index,)).fetchall()
+        return [textRowToData(row) for row in rows]
+
+    def readPage(self, page_index):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT path, gui_info FROM pages WHERE page_index = ?",
+                (page_index,)).fetchone()
+        if row == None:
+            return None
+        return {
+            'path': row[0],
+            'gui_info': json.loads(row[1]),
+            'text': self.readPageTexts(page_index)
+        }
+
+    def readData(self):
+        # all the proyect on the json layout of the .gmt files
+        pages = []
+        for page_index, (path, gui_info) in enumerate(self.readPageList()):
+            pages.append({
+                'path': path,
+                'gui_info': gui_info,
+                'text': self.readPageTexts(page_index)
+            })
+        return { 'pages': pages }
+
+    def writeData(self, data):
+        # replaces all the content, on a single transaction
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM texts")
+            self.connection.execute("DELETE FROM pages")
+            for page_index, page in enumerate(data['pages']):
+                self.connection.execute(
+                    "INSERT INTO pages (page_index, path, gui_info) VALUES (?, ?, ?)",
+                    (page_index, page['path'], json.dumps(page['gui_info'], ensure_ascii=False)))
+                self.connection.executemany(
+                    """INSERT INTO texts (page_index, position, id, start_x, start_y,
+                    end_x, end_y, raw_text, machine_translation)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [textDataToRow(page_index, position, text)
+                     for position, text in enumerate(page['text'])])
+
+    def applyRecords(self, records):
+        # the same records that go to the journal of the .gmt files,
+        # all of them are applied or none if something fails.
+        if not records:
+            return
+        with self.lock, self.connection:
+            for record in records:
+                self.applyRecord(record)
+
+    def applyRecord(self, record):
+        operation = record['op']
+        page_index = record['page']
+        if operation == 'add_page':
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages (page_index, path, gui_info) VALUES (?, ?, ?)",
+                (page_index, record['path'], json.dumps(record['gui_info'], ensure_ascii=False)))
+        elif operation == 'gui_info':
+            self.connection.execute(
+                "UPDATE pages SET gui_info = ? WHERE page_index = ?",
+                (json.dumps(record['gui_info'], ensure_ascii=False), page_index))
+        elif operation == 'set_text':
+            text = record['text']
+            row = self.connection.execute(
+                "SELECT position FROM texts WHERE page_index = ? AND id = ?",
+                (page_index, text['id'])).fetchone()
+            if row != None:
+                position = row[0]
+            else:
+                # a new text goes at the end of the page
+                position = self.connection.execute(
+                    "SELECT COALESCE(MAX(position), -1) + 1 FROM texts WHERE page_index = ?",
+                    (page_index,)).fetchone()[0]
+            self.connection.execute(
+                """INSERT OR REPLACE INTO texts (page_index, position, id, start_x, start_y,
+                end_x, end_y, raw_text, machine_translation)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                textDataToRow(page_index, position, text))
+        elif operation == 'remove_text':
+            self.connection.execute(
+                "DELETE FROM texts WHERE page_index = ? AND id = ?",
+                (page_index, record['id']))
+        elif operation == 'order':
+            self.connection.executemany(
+                "UPDATE texts SET position = ? WHERE page_index = ? AND id = ?",
+                [(position, page_index, id) for position, id in enumerate(record['ids'])])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def importGmt(gmt_path, store_path):
+    data = loadGmt(gmt_path)
+    store = ProyectStore(store_path)
+    store.writeData(data)
+    store.close()
+    return len(data['pages'])
+
+
+def exportGmt(store_path, gmt_path):
+    store = ProyectStore(store_path)
+    data = store.readData()
+    store.close()
+    writeFileAtomically(gmt_path, json.dumps(data, indent=2, ensure_ascii=False))
+    return len(data['pages'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert between .gmt and .gmtdb proyects')
+    parser.add_argument('command', choices=['import', 'export'],
+                        help='import: .gmt to .gmtdb, export: .gmtdb to .gmt')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        number_pages = importGmt(args.input, args.output)
+    else:
+        number_pages = exportGmt(args.input, args.output)
+    print(f'{number_pages} pages written to {args.output}')
+    sys.exit(0)
@@ -0,0 +1,49 @@
+# Uniform grid over the page, each cell knows the rects that touch it,
+# so asking what is under a point only checks the rects of one cell
+# instead of all the rects of the page.
+
+GRID_CELL_SIZE = 256
+
+
+class SpatialGrid():
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.item_cells = {}
+
+    def getCells(self, definition):
+        (x, y, w, h) = definition
+        size = self.cell_size
+        return [(cell_x, cell_y)
+                for cell_x in range(int(x) // size, int(x + w) // size + 1)
+                for cell_y in range(int(y) // size, int(y + h) // size + 1)]
+
+    def insert(self, key, item, definition):
+        # also used to update, when the rect moved or changed size
+        cells = self.getCells(definition)
+        old_cells = self.item_cells.get(key)
+        if old_cells == cells:
+            return
+        if old_cells:
+            self.remove(key)
+        for cell in cells:
+            self.cells.setdefault(cell, {})[key] = item
+        self.item_cells[key] = cells
+
+    def remove(self, key):
+        for cell in self.item_cells.pop(key, []):
+            items = self.cells.get(cell)
+            if items == None:
+                continue
+            items.pop(key, None)
+            if not items:
+                del self.cells[cell]
+
+    def queryPoint(self, x, y):
+        # candidates only, the caller checks if the point is really inside
+        cell = (int(x) // self.cell_size, int(y) // self.cell_size)
+        return list(self.cells.get(cell, {}).values())
+
+    def clear(self):
+        self.cells = {}
+        self.item_cells = {}
@@ -0,0 +1,82 @@
+# Opens the gui several times and reports how long it takes to show the
+# window and to have the ocr ready, to catch the changes that make the
+# startup slower.
+#
+#   uv run StartupBenchmark.py --runs 5
+#   uv run StartupBenchmark.py --runs 5 --json >> startup_history.jsonl
+#
+# On a machine without display use QT_QPA_PLATFORM=offscreen.
+import subprocess
+import statistics
+import argparse
+import json
+import time
+import sys
+import os
+
+STARTUP_METRICS = ('imports', 'window', 'ocr_ready')
+
+
+def parseStartupLine(line):
+    # "startup: imports=0.123 window=0.456 ocr_ready=7.890"
+    times = {}
+    for field in line[len('startup:'):].split():
+        (name, value) = field.split('=')
+        times[name] = float(value)
+    return times
+
+
+def runOnce(timeout):
+    environment = dict(os.environ, GOMATA_STARTUP_BENCHMARK='1')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main_gui.py')
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, script],
+        cwd=os.path.dirname(script),
+        env=environment,
+        capture_output=True,
+        text=True,
+        timeout=timeout)
+    elapsed = time.perf_counter() - start
+    for line in process.stdout.splitlines():
+        if line.startswith('startup:'):
+            times = parseStartupLine(line)
+            times['process'] = elapsed
+            return times
+    raise RuntimeError(f'no startup times reported (exit code {process.returncode})\n{process.stderr}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the startup time of the gui')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds to wait for each run')
+    parser.add_argument('--json', action='store_true',
+                        help='print a single json line with the results')
+    args = parser.parse_args()
+
+    runs = []
+    for index in range(args.runs):
+        times = runOnce(args.timeout)
+        runs.append(times)
+        if not args.json:
+            print(f'run {index + 1}: ' + ' '.join(f'{name}={value:.3f}s' for name, value in times.items()))
+
+    summary = {}
+    for name in STARTUP_METRICS + ('process',):
+        values = [times[name] for times in runs if name in times]
+        if values:
+            summary[name] = {
+                'median': statistics.median(values),
+                'min': min(values),
+                'max': max(values),
+            }
+
+    if args.json:
+        print(json.dumps({ 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': len(runs), 'summary': summary }))
+    else:
+        print(f'{"":>10} {"median":>8} {"min":>8} {"max":>8}')
+        for name, values in summary.items():
+            print(f'{name:>10} {values["median"]:>7.3f}s {values["min"]:>7.3f}s {values["max"]:>7.3f}s')
+        if not 'ocr_ready' in summary:
+            print('the ocr failed to load on every run, ocr_ready was not measured')
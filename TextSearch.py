@@ -0,0 +1,129 @@
+# Full text search over the recognized text and the translations of
+# every region of the proyect. The japanese has no spaces between words,
+# so instead of words the index keeps the characters and pairs of
+# characters (bigrams) of every text, a query is looked up by its
+# bigrams and then checked on the few regions that have all of them.
+import unicodedata
+import threading
+
+SEARCH_FIELDS = ('raw_text', 'machine_translation')
+DEFAULT_SEARCH_LIMIT = 200
+
+
+def normalizeText(text):
+    # full width and half width forms are the same character for search,
+    # and the case does not matter for the translations.
+    if not text:
+        return ''
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def getGrams(text):
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def getQueryGrams(query):
+    # the bigrams are enough, a single character is its own gram
+    if len(query) == 1:
+        return {query}
+    return {query[i:i + 2] for i in range(len(query) - 1)}
+
+
+class SearchResult():
+    def __init__(self, page_index, rect_id, field, text):
+        self.page_index = page_index
+        self.rect_id = rect_id
+        self.field = field
+        self.text = text
+
+
+class TextSearchIndex():
+    def __init__(self):
+        # filled from the proyect loader thread and read on the gui
+        self.lock = threading.Lock()
+        # (page_index, rect_id, field) -> (text, normalized text)
+        self.entries = {}
+        # gram -> keys of the entries that have it
+        self.postings = {}
+        self.page_keys = {}
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.postings = {}
+            self.page_keys = {}
+
+    def removeEntry(self, key):
+        entry = self.entries.pop(key, None)
+        if entry == None:
+            return
+        for gram in getGrams(entry[1]):
+            keys = self.postings.get(gram)
+            if keys == None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+        self.page_keys[key[0]].discard(key)
+
+    def setEntry(self, key, text):
+        old_entry = self.entries.get(key)
+        if old_entry != None and old_entry[0] == text:
+            return
+        self.removeEntry(key)
+        normalized = normalizeText(text)
+        if not normalized:
+            return
+        self.entries[key] = (text, normalized)
+        for gram in getGrams(normalized):
+            self.postings.setdefault(gram, set()).add(key)
+        self.page_keys.setdefault(key[0], set()).add(key)
+
+    def updateText(self, page_index, rect_id, field, text):
+        # a new ocr or translation result for a single region
+        with self.lock:
+            self.setEntry((page_index, f'{rect_id}', field), text)
+
+    def indexPage(self, page_index, texts_data):
+        # texts_data on the json layout of the .gmt files, it replaces
+        # what the page had, so the removed regions are forgotten.
+        with self.lock:
+            new_keys = set()
+            for text in texts_data:
+                for field in SEARCH_FIELDS:
+                    key = (page_index, f'{text['id']}', field)
+                    self.setEntry(key, text.get(field))
+                    new_keys.add(key)
+            for key in list(self.page_keys.get(page_index, ())):
+                if not key in new_keys:
+                    self.removeEntry(key)
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        query = normalizeText(query).strip()
+        if not query:
+            return []
+        with self.lock:
+            posting_lists = []
+            for gram in getQueryGrams(query):
+                keys = self.postings.get(gram)
+                if keys == None:
+                    return []
+                posting_lists.append(keys)
+            # starting from the rarest gram keeps the intersection small
+            posting_lists.sort(key=len)
+            candidates = set(posting_lists[0])
+            for keys in posting_lists[1:]:
+                candidates &= keys
+                if not candidates:
+                    return []
+            results = []
+            for key in sorted(candidates):
+                (text, normalized) = self.entries[key]
+                # having all the bigrams does not mean having them in order
+                if query in normalized:
+                    results.append(SearchResult(key[0], key[1], key[2], text))
+                    if len(results) >= limit:
+                        break
+        return results
@@ -0,0 +1,89 @@
+from PyQt6.QtCore import QObject, pyqtSignal, Qt, QSize
+from PyQt6.QtGui import QImage, QImageReader
+from concurrent.futures import ThreadPoolExecutor
+from Cache import getUserCacheDir
+import threading
+import hashlib
+import os
+
+THUMBNAIL_SIZE = 100
+THUMBNAIL_WORKERS = 4
+
+
+class ThumbnailLoader(QObject):
+    # Makes the thumbnails of the pages on a pool of workers, decoding
+    # the images already reduced, and keeps them on disk so a known
+    # proyect shows them right away the next time it is opened.
+    # emits (generation, page_index, thumbnail)
+    thumbnailReady = pyqtSignal(int, int, QImage)
+
+    def __init__(self, cache_dir=None, size=THUMBNAIL_SIZE):
+        super().__init__()
+        self.size = size
+        self.cache_dir = cache_dir if cache_dir else os.path.join(getUserCacheDir(), 'thumbnails')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        self.lock = threading.Lock()
+        # changes each time the list of pages is cleared, to
+        # ignore the thumbnails of the pages that were before.
+        self.generation = 0
+
+    def cancelPending(self):
+        with self.lock:
+            self.generation += 1
+        return self.generation
+
+    def request(self, page_index, path):
+        generation = self.generation
+        self.executor.submit(self.runRequest, generation, page_index, path)
+
+    def runRequest(self, generation, page_index, path):
+        with self.lock:
+            if generation != self.generation:
+                return # the list was cleared while waiting
+        try:
+            thumbnail = self.loadThumbnail(path)
+        except Exception as e:
+            print(f'Failed to create thumbnail of {path}: {e}')
+            return
+        if thumbnail.isNull():
+            return
+        self.thumbnailReady.emit(generation, page_index, thumbnail)
+
+    def getCachePath(self, path):
+        # when the file changes, the key changes too
+        stat = os.stat(path)
+        key = f'{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}'
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.png')
+
+    def loadThumbnail(self, path):
+        cache_path = self.getCachePath(path)
+        if os.path.exists(cache_path):
+            thumbnail = QImage(cache_path)
+            if not thumbnail.isNull():
+                return thumbnail
+
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        full_size = reader.size()
+        if full_size.isValid():
+            # the reader only decodes what is needed for this size
+            # (for jpeg it scales on the decoder itself)
+            reader.setScaledSize(full_size.scaled(
+                QSize(self.size, self.size), Qt.AspectRatioMode.KeepAspectRatio))
+        thumbnail = reader.read()
+        if thumbnail.isNull():
+            return thumbnail
+        if not full_size.isValid():
+            thumbnail = thumbnail.scaled(
+                self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio)
+
+        temporal_path = f'{cache_path}.{threading.get_ident()}.tmp'
+        if thumbnail.save(temporal_path, 'PNG'):
+            os.replace(temporal_path, cache_path)
+        return thumbnail
+
+    def shutdown(self):
+        self.cancelPending()
+        self.executor.shutdown(wait=False, cancel_futures=True)
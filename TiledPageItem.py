@@ -0,0 +1,74 @@
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+from PyQt6.QtGui import QPainter
+from PyQt6.QtCore import Qt, QRectF
+from math import floor, log2
+
+# size on page pixels of each tile
+TILE_SIZE = 512
+# smallest size of the side of a level of the pyramid
+MIN_LEVEL_SIZE = 256
+
+
+class TiledPageItem(QGraphicsItem):
+    # Draws a page as a grid of tiles, only the tiles on the exposed
+    # area are painted, and they are taken from a mip pyramid so when
+    # the view is zoomed out there is no need to resample all the page.
+    def __init__(self, pixmap):
+        super().__init__()
+        self.levels = [pixmap]
+        self.width = pixmap.width()
+        self.height = pixmap.height()
+        # so paint gets the exposed rect, and not always all the item
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.width, self.height)
+
+    def getMaxLevel(self):
+        longest_side = max(self.width, self.height)
+        if longest_side <= MIN_LEVEL_SIZE:
+            return 0
+        return int(floor(log2(longest_side / MIN_LEVEL_SIZE)))
+
+    def getLevel(self, level):
+        # each level is half of the one before, made only when needed
+        while len(self.levels) <= level:
+            previous = self.levels[-1]
+            self.levels.append(previous.scaled(
+                max(1, previous.width() // 2),
+                max(1, previous.height() // 2),
+                Qt.AspectRatioMode.IgnoreAspectRatio,
+                Qt.TransformationMode.SmoothTransformation))
+        return self.levels[level]
+
+    def chooseLevel(self, painter):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if scale >= 1:
+            return 0
+        return min(self.getMaxLevel(), int(floor(log2(1 / scale))))
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        level = self.chooseLevel(painter)
+        source = self.getLevel(level)
+        # from page pixels to pixels of the level
+        ratio_x = source.width() / self.width
+        ratio_y = source.height() / self.height
+
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+        first_column = int(exposed.left()) // TILE_SIZE
+        last_column = int(exposed.right()) // TILE_SIZE
+        first_row = int(exposed.top()) // TILE_SIZE
+        last_row = int(exposed.bottom()) // TILE_SIZE
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                target = QRectF(column * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                target = target.intersected(self.boundingRect())
+                if target.isEmpty():
+                    continue
+                tile_source = QRectF(
+                    target.x() * ratio_x, target.y() * ratio_y,
+                    target.width() * ratio_x, target.height() * ratio_y)
+                painter.drawPixmap(target, source, tile_source)
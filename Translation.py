@@ -0,0 +1,250 @@
+from concurrent.futures import Future
+import threading
+import asyncio
+import random
+import time
+import re
+import os
+
+# backend used when GOMATA_TRANSLATION_BACKEND is not set
+DEFAULT_BACKEND = 'google'
+DEFAULT_LOCAL_URL = 'http://127.0.0.1:8765/translate'
+
+# limits used to not get throttled when many bubbles are sent at once
+REQUESTS_PER_SECOND = 5
+BURST_SIZE = 10
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+
+class TranslationError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def is_retryable(self):
+        # no status means the request never got an answer (timeout, reset...)
+        return self.status == None or self.status == 429 or self.status >= 500
+
+
+class TranslationBackend():
+    # Interface of the translation backends, all the methods
+    # are called from the translation event loop.
+    name = 'none'
+
+    async def translate(self, text, src, dest):
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+
+class GoogleBackend(TranslationBackend):
+    name = 'google'
+
+    def __init__(self):
+        self.translator = None
+
+    async def translate(self, text, src, dest):
+        import httpx
+        from googletrans import Translator
+        if not self.translator:
+            # with raise_exception googletrans fails on a bad status
+            # instead of returning the original text as translation.
+            self.translator = Translator(raise_exception=True)
+            await self.translator.__aenter__()
+        try:
+            result = await self.translator.translate(text, src=src, dest=dest)
+        except httpx.TransportError as e:
+            raise TranslationError(f'{e}') from e
+        except Exception as e:
+            # googletrans only reports the status inside the message
+            match = re.search(r'status code "(\d+)"', f'{e}')
+            if not match:
+                raise
+            raise TranslationError(f'{e}', status=int(match.group(1))) from e
+        return result.text
+
+    async def close(self):
+        if self.translator:
+            await self.translator.__aexit__(None, None, None)
+            self.translator = None
+
+
+class LocalHTTPBackend(TranslationBackend):
+    # Talks with LocalTranslateServer.py, to test all the pipeline
+    # without network or without being throttled by google.
+    name = 'local'
+
+    def __init__(self, url=DEFAULT_LOCAL_URL):
+        self.url = url
+        self.client = None
+
+    async def translate(self, text, src, dest):
+        import httpx
+        if not self.client:
+            self.client = httpx.AsyncClient(timeout=10)
+        try:
+            response = await self.client.post(
+                self.url, json={'text': text, 'src': src, 'dest': dest})
+        except httpx.TransportError as e:
+            raise TranslationError(f'{e}') from e
+        if response.status_code != 200:
+            retry_after = response.headers.get('Retry-After')
+            raise TranslationError(
+                f'Unexpected status code {response.status_code} from {self.url}',
+                status=response.status_code,
+                retry_after=float(retry_after) if retry_after else None)
+        return response.json()['translation']
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+
+class TokenBucket():
+    # only used from the event loop thread, so there is no lock,
+    # between the check and the take of a token there is no await.
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimitedBackend(TranslationBackend):
+    # Wraps other backend with a rate limit, a maximum of concurrent
+    # requests and retries with jittered exponential backoff.
+    def __init__(self, backend,
+                 requests_per_second=REQUESTS_PER_SECOND,
+                 burst_size=BURST_SIZE,
+                 max_concurrent=MAX_CONCURRENT_REQUESTS,
+                 max_retries=MAX_RETRIES):
+        self.backend = backend
+        self.name = backend.name
+        self.bucket = TokenBucket(requests_per_second, burst_size)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_retries = max_retries
+        self.number_retries = 0
+
+    def getBackoff(self, attempt, error):
+        if error.retry_after:
+            return error.retry_after
+        # "full jitter", so all the throttled requests do not come back together
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    async def translate(self, text, src, dest):
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            async with self.semaphore:
+                try:
+                    return await self.backend.translate(text, src, dest)
+                except TranslationError as e:
+                    if not e.is_retryable or attempt >= self.max_retries:
+                        raise
+                    delay = self.getBackoff(attempt, e)
+                    status = e.status
+            attempt += 1
+            self.number_retries += 1
+            print(f'translation failed ({status}), retry {attempt} in {delay:.2f}s')
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.backend.close()
+
+
+def createTranslationBackend(name=None):
+    name = name if name else os.environ.get('GOMATA_TRANSLATION_BACKEND', DEFAULT_BACKEND)
+    if name == 'local':
+        url = os.environ.get('GOMATA_LOCAL_TRANSLATE_URL', DEFAULT_LOCAL_URL)
+        backend = LocalHTTPBackend(url)
+    elif name == 'google':
+        backend = GoogleBackend()
+    else:
+        raise ValueError(f'Unknown translation backend "{name}"')
+    return RateLimitedBackend(backend)
+
+
+class AsyncLoopThread():
+    # A thread that runs one event loop for all the life of the window,
+    # the coroutines submitted to it share whatever the loop owns
+    # (like the http client of the translator) instead of creating it again.
+    def __init__(self, name="gomata-async-loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        # returns a concurrent.futures.Future, safe to wait from any thread
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self, timeout=2):
+        if not self.loop.is_running():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class TranslationService():
+    # Front of the translator, every request first looks on the cache,
+    # then joins a request already in flight for the same text, and
+    # only when there is none a new one is sent.
+    def __init__(self, loop_thread, translate_coroutine, cache=None, backend='google', src='auto'):
+        self.loop_thread = loop_thread
+        # async function (text, dest) -> translated text
+        self.translate_coroutine = translate_coroutine
+        self.cache = cache
+        self.backend = backend
+        self.src = src
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def translate(self, text, dest="es"):
+        key = (text, self.src, dest, self.backend)
+        if self.cache:
+            cached = self.cache.get(*key)
+            if cached != None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future:
+                return future
+            future = self.loop_thread.submit(self.runTranslation(key))
+            self.in_flight[key] = future
+        future.add_done_callback(lambda future: self.finishRequest(key))
+        return future
+
+    async def runTranslation(self, key):
+        (text, src, dest, backend) = key
+        result = await self.translate_coroutine(text, dest)
+        if self.cache:
+            self.cache.put(text, src, dest, backend, result)
+        return result
+
+    def finishRequest(self, key):
+        with self.lock:
+            self.in_flight.pop(key, None)
@@ -0,0 +1,276 @@
+# Headless batch processing of whole proyects, runs the ocr and the
+# translation of every text region of every page, without the gui.
+#
+#   uv run gomata_cli.py volume_01.gmt
+#   uv run gomata_cli.py ./volume_01/ -o volume_01.gmt --workers 4
+#
+# A folder of images has no regions yet, they are taken from the speech
+# bubbles found on each page (see BubbleDetector.py).
+#   uv run gomata_cli.py series.gmtdb
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from PyQt6.QtCore import QPointF
+from uuid import uuid4 as uuid
+import multiprocessing
+import argparse
+import sys
+import os
+
+from InfoProyect import InfoProyect, getTextDefinition, IMAGE_EXTENSIONS
+from ProyectStore import ProyectStore, isStorePath
+from ProyectJournal import loadGmt, writeFileAtomically
+from BatchOCR import (DEFAULT_BATCH_SIZE, OCR_ENGINES, groupByAspectRatio, recognizeBatch,
+    getOCREngineName, getOCREngineId, prepareOCREngine, createOCREngine)
+
+# each worker process loads its own copy of the model once,
+# and reuses it for all the pages it gets.
+WORKER_OCR = None
+WORKER_CACHE = None
+
+
+def initWorker(number_workers, use_cache, engine_name, model_dir):
+    global WORKER_OCR, WORKER_CACHE
+    from OCRDaemon import connectToDaemon
+    engine_id = getOCREngineId(engine_name)
+    # with an ocr daemon running, the workers send it their crops
+    WORKER_OCR = connectToDaemon(engine_id=engine_id)
+    if WORKER_OCR == None:
+        # to not have every worker fighting for all the cores
+        number_threads = max(1, (os.cpu_count() or 1) // number_workers)
+        if engine_name == 'torch':
+            import torch
+            torch.set_num_threads(number_threads)
+        WORKER_OCR = createOCREngine(engine_name, number_threads, model_dir)
+    if use_cache:
+        from Cache import OCRCache
+        WORKER_CACHE = OCRCache(engine_id)
+
+
+def recognizePage(page_index, path, regions, batch_size):
+    # regions is a list of (id, (x, y, w, h)), returns a list of (id, text)
+    from PIL import Image
+    page_image = Image.open(path)
+    page_image.load()
+
+    results = []
+    pending = []
+    for (region_id, (x, y, w, h)) in regions:
+        crop = page_image.crop((x, y, x + w, y + h))
+        key = WORKER_CACHE.makeKey(crop) if WORKER_CACHE else None
+        text = WORKER_CACHE.get(key) if key else None
+        if text != None:
+            results.append((region_id, text))
+            continue
+        pending.append((region_id, crop, key))
+
+    for batch in groupByAspectRatio(pending, batch_size, get_image=lambda item: item[1]):
+        texts = recognizeBatch(WORKER_OCR, [crop for (_, crop, _) in batch])
+        for (region_id, _, key), text in zip(batch, texts):
+            if key:
+                WORKER_CACHE.put(key, text)
+            results.append((region_id, text))
+    return (page_index, results)
+
+
+def loadProyect(input_path):
+    proyect = InfoProyect()
+    if os.path.isdir(input_path):
+        # a folder only gives the pages, there are no regions on it yet
+        for filename in sorted(os.listdir(input_path)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                proyect.pushPage(os.path.join(input_path, filename))
+        return proyect
+
+    if isStorePath(input_path):
+        proyect.loadFromStore(ProyectStore(input_path))
+        return proyect
+
+    # with the changes the gui left on the journal
+    parsed = loadGmt(input_path)
+    for page in parsed['pages']:
+        index = proyect.pushPage(page['path'])
+        proyect.loadPageData(index, page)
+    return proyect
+
+
+def detectPageRegions(path):
+    from PIL import Image
+    from BubbleDetector import findBubbles
+    import numpy
+    with Image.open(path) as page_image:
+        gray = numpy.asarray(page_image.convert("L"))
+    return findBubbles(gray)
+
+
+def addDetectedRegions(proyect, number_workers):
+    # numpy and the decoding release the gil, so threads are enough
+    number_regions = 0
+    with ThreadPoolExecutor(max_workers=number_workers) as pool:
+        futures = { pool.submit(detectPageRegions, proyect.getPath(page_index)): page_index
+                    for page_index in range(len(proyect.pages)) }
+        for future in as_completed(futures):
+            page_index = futures[future]
+            try:
+                definitions = future.result()
+            except Exception as e:
+                print(f'Failed to look for text regions on page {page_index + 1}: {e}')
+                continue
+            proyect.saveTextSelections(page_index, [{
+                'initial_pos': QPointF(x, y),
+                'end_pos': QPointF(x + w, y + h),
+                'id': uuid(),
+                'raw_text': None,
+                'machine_translation': None
+            } for (x, y, w, h) in definitions])
+            number_regions += len(definitions)
+    print(f'{number_regions} text regions found on {len(proyect.pages)} pages')
+    return number_regions
+
+
+def saveProyect(proyect, output_path):
+    if isStorePath(output_path):
+        data = proyect.toData() # read all before, it may be the same store
+        store = ProyectStore(output_path)
+        store.writeData(data)
+        store.close()
+        return
+    writeFileAtomically(output_path, proyect.toString())
+
+
+def getPendingRegions(proyect, page_index, force):
+    regions = []
+    for text in proyect.getListTexts(page_index):
+        if text['raw_text'] and text['raw_text'] != '[OCR FAILED]' and not force:
+            continue
+        regions.append((text['id'], getTextDefinition(text)))
+    return regions
+
+
+def runOCR(proyect, args, on_text_found):
+    jobs = []
+    for page_index in range(len(proyect.pages)):
+        regions = getPendingRegions(proyect, page_index, args.force)
+        if regions:
+            jobs.append((page_index, proyect.getPath(page_index), regions))
+    if not jobs:
+        print('No regions pending for character recognition')
+        return
+
+    # done here once, and not by every worker at the same time
+    engine_name = args.engine
+    model_dir = prepareOCREngine(engine_name)
+
+    number_workers = max(1, min(args.workers, len(jobs)))
+    print(f'Recognizing {sum(len(job[2]) for job in jobs)} regions '
+          f'on {len(jobs)} pages with {number_workers} workers')
+    # spawn, as forking a process with torch and threads already running is not safe
+    with ProcessPoolExecutor(
+            max_workers=number_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initWorker,
+            initargs=(number_workers, not args.no_cache, engine_name, model_dir)) as pool:
+        futures = [pool.submit(recognizePage, page_index, path, regions, args.batch_size)
+                   for (page_index, path, regions) in jobs]
+        for future in as_completed(futures):
+            try:
+                (page_index, results) = future.result()
+            except Exception as e:
+                print(f'OCR failed: {e}')
+                continue
+            for (region_id, text) in results:
+                text_info = proyect.findText(page_index, region_id)
+                text_info['raw_text'] = text
+                on_text_found(page_index, text_info)
+            print(f'page {page_index + 1}/{len(proyect.pages)}: {len(results)} regions recognized')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the ocr and machine translation of a whole gomata proyect')
+    parser.add_argument('input', help='a .gmt or .gmtdb proyect or a folder of images')
+    parser.add_argument('-o', '--output',
+                        help='.gmt or .gmtdb file to write (default: overwrite the input proyect)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='number of ocr worker processes')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--engine', default=None, choices=OCR_ENGINES,
+                        help='ocr engine (default: GOMATA_OCR_ENGINE or torch)')
+    parser.add_argument('--dest', default='es', help='language of the translation')
+    parser.add_argument('--backend', default=None, help='translation backend (google or local)')
+    parser.add_argument('--no-translate', action='store_true')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the ocr cache')
+    parser.add_argument('--force', action='store_true',
+                        help='recognize again the regions that already have text')
+    args = parser.parse_args()
+    # the engine may also come from GOMATA_OCR_ENGINE, checked here too
+    # so a wrong value is a usage error and not a traceback later
+    try:
+        args.engine = getOCREngineName(args.engine)
+    except ValueError as e:
+        parser.error(f'{e}')
+
+    output_path = args.output
+    if not output_path:
+        if os.path.isdir(args.input):
+            output_path = os.path.join(args.input, f'{os.path.basename(os.path.abspath(args.input))}.gmt')
+        else:
+            output_path = args.input
+    if not (output_path.endswith('.gmt') or isStorePath(output_path)):
+        output_path += '.gmt'
+
+    proyect = loadProyect(args.input)
+    print(f'{len(proyect.pages)} pages loaded from {args.input}')
+    if os.path.isdir(args.input):
+        if addDetectedRegions(proyect, max(1, args.workers)) == 0:
+            print('No text regions were found, draw or detect them on the gui first')
+            return 1
+
+    translation_futures = []
+    translation_loop = None
+    translation_backend = None
+    if not args.no_translate:
+        from Translation import AsyncLoopThread, TranslationService, createTranslationBackend
+        from Cache import TranslationCache
+        translation_loop = AsyncLoopThread()
+        translation_backend = createTranslationBackend(args.backend)
+        translation_service = TranslationService(
+            translation_loop,
+            lambda text, dest: translation_backend.translate(text, 'auto', dest),
+            cache=TranslationCache(),
+            backend=translation_backend.name)
+
+    def queueTranslation(page_index, text_info):
+        if args.no_translate or text_info['raw_text'] == '[OCR FAILED]':
+            return
+        if text_info['machine_translation'] and not args.force:
+            return
+        future = translation_service.translate(text_info['raw_text'], args.dest)
+        translation_futures.append((text_info, future))
+
+    # translations start as soon as each page is recognized,
+    # the already recognized regions without translation go first.
+    if not args.force:
+        for page_index in range(len(proyect.pages)):
+            for text_info in proyect.getListTexts(page_index):
+                if text_info['raw_text']:
+                    queueTranslation(page_index, text_info)
+    runOCR(proyect, args, queueTranslation)
+
+    number_failed = 0
+    for (text_info, future) in translation_futures:
+        try:
+            text_info['machine_translation'] = future.result()
+        except Exception as e:
+            number_failed += 1
+            print(f'Translation failed for "{text_info['raw_text']}": {e}')
+    if translation_loop:
+        translation_loop.submit(translation_backend.close()).result()
+        translation_loop.stop()
+        print(f'{len(translation_futures) - number_failed} regions translated, {number_failed} failed')
+
+    saveProyect(proyect, output_path)
+    print(f'Saved to {output_path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,69 @@
+# taken before anything else is imported, for the startup benchmark
+import time
+STARTUP_TIME = time.perf_counter()
+
 from PyQt6.QtWidgets import (QApplication, QMainWindow, 
     QGraphicsScene, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, 
     QFileDialog, QLabel, QSplitter, QScrollArea, QTabWidget, QSizePolicy)
-from PyQt6.QtGui import QPixmap, QIcon, QAction, QImage
-from PyQt6.QtCore import Qt, QRectF, QSize, QPointF
+from PyQt6.QtGui import QPixmap, QIcon, QAction
+from PyQt6.QtCore import Qt, QRectF, QPointF, QSize, QEvent, QTimer, pyqtSignal
 from ImageDrawingArea import ImageDrawingArea
 from InfoAreas import ListOfImagesArea, CollapsibleSection, AreaDetails
-from PIL import Image
+from JobQueue import TextJobQueue
+from BatchOCR import getOCREngineName, getOCREngineId, createOCREngine, DEFAULT_OCR_ENGINE
+from Cache import OCRCache
+from PagePrefetcher import PagePrefetcher, decodePage
+from PageBuffer import PageBuffer
+from PageCache import DEFAULT_PAGE_CACHE_BYTES
+from TiledPageItem import TiledPageItem
+from Thumbnails import ThumbnailLoader, THUMBNAIL_SIZE
+from InfoProyect import InfoProyect, getTextDefinition, textEntryToData, IMAGE_EXTENSIONS
+from ProyectJournal import ProyectJournal
+from ProyectStore import ProyectStore, isStorePath
+from ProyectLoader import ProyectLoader
+from TextSearch import TextSearchIndex
+from BubbleDetector import BubbleDetector, filterNewRegions
 import sys
 import os
-from uuid import UUID, uuid4 as uuid
-import json
+from uuid import uuid4 as uuid, UUID
+from collections import deque
 import subprocess
-
-# this is to load dinamicaly manga-ocr
-import importlib
 from concurrent.futures import ThreadPoolExecutor
 
-# google translator webscraping
-import asyncio
-from googletrans import Translator
 
-translator = Translator()
+# how many crops are sent together to the ocr model
+OCR_BATCH_SIZE = 8
+
+# when detecting the regions of all the pages, the next pages are not
+# detected while this many crops are waiting for the ocr, each page on
+# the queue holds its whole page buffer until its crops are taken.
+DETECTION_OCR_BACKLOG = 32
+MAX_PAGES_DETECTING = 2
+
+# the ocr model starts loading this long after the window is shown,
+# so it does not fight with the first paint for the cpu.
+OCR_LOAD_DELAY = 200
+
+# with this set, the startup times are printed and the app closes
+# as soon as the ocr is ready (see StartupBenchmark.py)
+IS_STARTUP_BENCHMARK = os.environ.get('GOMATA_STARTUP_BENCHMARK') == '1'
+
+
+# files that already have the mime type, xdg-mime is slow
+# enough to be noticed if it runs on every save.
+MIME_REGISTERED_FILES = set()
+
+# the changes are saved to the journal every little while, and the
+# journal is folded into the .gmt file once it gets long enough.
+AUTOSAVE_INTERVAL = 30 * 1000
+COMPACTION_INTERVAL = 5 * 60 * 1000
+JOURNAL_MAX_RECORDS = 500
 
 
 def set_mime_type_linux(file_name):
+    if file_name in MIME_REGISTERED_FILES:
+        return
+    MIME_REGISTERED_FILES.add(file_name)
     try:
         subprocess.run(["xdg-mime", "install", "--mode", "user", file_name])
         subprocess.run(["xdg-mime", "default", "application/json", file_name])
@@ -32,110 +72,135 @@ def set_mime_type_linux(file_name):
         print(f"Failed to set MIME type: {e}")
 
 
-class InfoProyect():
-    def __init__(self):
-        self.pages = []
-    
-    def pushPage(self, pixmap, path):
-        print(f'push {pixmap} ({path})')
-        self.pages.append(
-            { "qtimg": pixmap,
-              "path": path,
-              "gui_info": {
-                  "showing_order": False,
-                  "showing_overlay_text": False
-              },
-              "text": []
-            }
-        )
-        return len(self.pages) - 1
-    
-    def toString(self):
-        clean_data = { 'pages':[] }
-        for page in self.pages:
-            clean_page_data = {
-                'path': page['path'],
-                'gui_info': page['gui_info'],
-                'text': []
-            }
-            for text in page["text"]:
-                start = text['initial_pos']
-                end = text['end_pos']
-                clean_text = {
-                    'id': f'{text['id']}',
-                    'start' : { 'x':int(start.x()), 'y':int(start.y()) },
-                    'end' : { 'x':int(end.x()), 'y':int(end.y()) },
-                    'raw_text': text['raw_text'],
-                    'machine_translation': text['machine_translation']
-                }
-                clean_page_data['text'].append(clean_text)
-            clean_data['pages'].append(clean_page_data)
-        data = json.dumps(clean_data, indent=2, ensure_ascii=False)
-        print(data)
-        return data
-    
-    def setPageGuiInfo(self, page_index, setting, value):
-        #print( f'set gui info of page {page_index} at "{setting}" to {value}' )
-        self.pages[page_index]["gui_info"][setting] = value
-    
-    def getPageGuiInfo(self, page_index, setting):
-        value = self.pages[page_index]["gui_info"][setting]
-        #print( f'get gui info of page {page_index} at "{setting}" ({value})' )
-        return value
-    
-    def getPixmap(self, page_index):
-        return self.pages[page_index]["qtimg"]
-    
-    def getPath(self, page_index):
-        return self.pages[page_index]["path"]
-    
-    def getListTexts(self, page_index):
-        return self.pages[page_index]["text"]
-    
-    def saveTextSelections(self, page_index, list_texts):
-        self.pages[page_index]["text"] = list_texts
-    
-    def clear(self):
-        self.pages = []
-
-LIST_QT_PIXMAPS = InfoProyect()
+# the pages not on screen are dropped when the decoded
+# pages use more memory than DEFAULT_PAGE_CACHE_BYTES.
+LIST_QT_PIXMAPS = InfoProyect(page_cache_bytes=DEFAULT_PAGE_CACHE_BYTES)
 
 class MainWindow(QMainWindow):
+    # emited from the thread that loads the ocr, Qt delivers them
+    # queued on the gui thread: (engine or None, error) and status text
+    ocrEngineLoaded = pyqtSignal(object, str)
+    ocrLoadStatus = pyqtSignal(str)
+    # (path, PageBuffer or None), from the worker that makes the buffer
+    pageBufferReady = pyqtSignal(str, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Gomata")
         self.setGeometry(100, 100, 900, 700)
 
+        self.startup_times = { 'imports': time.perf_counter() - STARTUP_TIME }
         self.executor = ThreadPoolExecutor()
         self.manga_ocr_instance = None
+        self.is_ocr_load_started = False
+
+        # ocr and translation run on the executor, the results
+        # come back to the gui thread throught the queue signals.
+        self.ocr_engine_error = None
+        try:
+            self.ocr_engine_name = getOCREngineName()
+        except ValueError as e:
+            # a typo on GOMATA_OCR_ENGINE should not keep the gui from starting
+            self.ocr_engine_name = DEFAULT_OCR_ENGINE
+            self.ocr_engine_error = f'{e}, using the {DEFAULT_OCR_ENGINE} engine'
+            print(self.ocr_engine_error)
+        self.ocr_cache = OCRCache(getOCREngineId(self.ocr_engine_name))
+        # the translation stack is started with the first translation
+        self.translation_loop = None
+        self.translation_backend = None
+        self.translation_service = None
+        self.job_queue = TextJobQueue(
+            self.executor, None,
+            ocr_batch_size=OCR_BATCH_SIZE,
+            ocr_cache=self.ocr_cache,
+            translation_service_factory=self.startTranslationService)
+        self.job_queue.ocrFinished.connect(self.onOCRFinished)
+        self.job_queue.ocrFailed.connect(self.onOCRFailed)
+        self.job_queue.translationFinished.connect(self.onTranslationFinished)
+        self.job_queue.translationFailed.connect(self.onTranslationFailed)
 
         self._is_showing_order = False
         self._is_showing_overlay_text = False
         self.current_file_name = None
+        self.proyect_journal = None
+
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosaveProyect)
+        self.autosave_timer.start(AUTOSAVE_INTERVAL)
+        self.compaction_timer = QTimer(self)
+        self.compaction_timer.timeout.connect(self.compactProyect)
+        self.compaction_timer.start(COMPACTION_INTERVAL)
 
         self.status_label = None
 
+        # the thumbnails are made on background and arrive one by one
+        self.thumbnail_loader = ThumbnailLoader()
+        self.thumbnail_loader.thumbnailReady.connect(self.onThumbnailReady)
+
+        # decodes the pages next to the one on screen
+        self.page_prefetcher = PagePrefetcher()
+        self.page_prefetcher.pageDecoded.connect(self.onPagePrefetched)
+
+        # the regions waiting for the page buffer of their page, by path
+        self.regions_waiting_buffer = {}
+        self.page_buffer_executor = ThreadPoolExecutor(max_workers=1)
+        self.pageBufferReady.connect(self.onPageBufferReady)
+
+        # the text and translations of every page, for the search tab
+        self.search_index = TextSearchIndex()
+
+        # proposes the regions of the speech bubbles, page by page
+        self.bubble_detector = BubbleDetector()
+        self.bubble_detector.regionsDetected.connect(self.onRegionsDetected)
+        self.bubble_detector.detectionFailed.connect(self.onRegionsDetectionFailed)
+        # the pages whose detected regions go straight to the ocr
+        self.pages_to_recognize = set()
+        # the ones of them waiting to be detected, and the ones being detected
+        self.pages_to_detect = deque()
+        self.pages_detecting = set()
+        self.is_ocr_load_failed = False
+        self.ocrEngineLoaded.connect(self.onOCREngineLoaded)
+        self.ocrLoadStatus.connect(self.updateStatusBar)
+
+        # the pages of a proyect being opened arrive by chunks
+        self.is_loading_proyect = False
+        self.proyect_loader = ProyectLoader()
+        self.proyect_loader.pagesLoaded.connect(self.onProyectPagesLoaded)
+        self.proyect_loader.loadFinished.connect(self.onProyectLoadFinished)
+        self.proyect_loader.loadFailed.connect(self.onProyectLoadFailed)
+
         self.defineActions()
         self.createMenuBar()
         self.createWindowContent()
-        self.startMangaOCR()
     
     def defineActions(self):
         self.open_file_action = QAction("Open File", self)
         self.save_proyect_action = QAction("Save File", self)
         self.load_folder_action = QAction("Add folder images", self)
         self.add_image_action = QAction("Add Image", self)
+        self.recognize_pending_action = QAction("Recognize pending areas", self)
+        self.search_action = QAction("Search", self)
+        self.detect_regions_action = QAction("Detect text regions", self)
+        self.detect_all_regions_action = QAction("Detect and recognize all pages", self)
 
         self.open_file_action.setShortcut("Ctrl+O")
         self.load_folder_action.setShortcut("Ctrl+F")
         self.save_proyect_action.setShortcut("Ctrl+S")
         self.add_image_action.setShortcut("Ctrl+I")
+        self.recognize_pending_action.setShortcut("Ctrl+R")
+        self.search_action.setShortcut("Ctrl+Shift+F")
+        self.detect_regions_action.setShortcut("Ctrl+D")
+        self.detect_all_regions_action.setShortcut("Ctrl+Shift+D")
 
 
         self.load_folder_action.triggered.connect(self.launchOpenFolderDialog)
         self.add_image_action.triggered.connect(self.launchOpenImagenDialog)
         self.open_file_action.triggered.connect(self.openGomataFile)
         self.save_proyect_action.triggered.connect(self.saveGomataFile)
+        self.recognize_pending_action.triggered.connect(self.queuePendingOCR)
+        self.search_action.triggered.connect(lambda: self.area_details.showSearch())
+        self.detect_regions_action.triggered.connect(self.detectPageRegions)
+        self.detect_all_regions_action.triggered.connect(self.detectAllRegions)
 
     @property
     def is_showing_order(self):
@@ -199,6 +264,16 @@ class MainWindow(QMainWindow):
         file_menu.addAction(self.load_folder_action)
         file_menu.addAction(self.add_image_action)
 
+        # Process menu
+        process_menu = menubar.addMenu("Process")
+        process_menu.addAction(self.recognize_pending_action)
+        process_menu.addAction(self.detect_regions_action)
+        process_menu.addAction(self.detect_all_regions_action)
+
+        # Edit menu
+        edit_menu = menubar.addMenu("Edit")
+        edit_menu.addAction(self.search_action)
+
     def createWindowContent(self):
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -264,119 +339,344 @@ class MainWindow(QMainWindow):
     def updateStatusBar(self, msg):
         self.status_label.setText(msg)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.is_ocr_load_started:
+            return
+        # the zero timer runs once the window had the chance to paint
+        QTimer.singleShot(0, self.onWindowShown)
+        QTimer.singleShot(OCR_LOAD_DELAY, self.startMangaOCR)
+
+    def onWindowShown(self):
+        if not 'window' in self.startup_times:
+            self.startup_times['window'] = time.perf_counter() - STARTUP_TIME
+
+    def reportStartupTimes(self):
+        # called on the gui thread once the ocr is ready (or failed)
+        times = ' '.join(f'{name}={value:.3f}' for name, value in self.startup_times.items())
+        print(f'startup: {times}', flush=True)
+        if IS_STARTUP_BENCHMARK:
+            QApplication.instance().quit()
+
+    def startTranslationService(self):
+        from Translation import AsyncLoopThread, TranslationService, createTranslationBackend
+        from Cache import TranslationCache
+        # one event loop and one backend (with its http client) are
+        # kept for all the translations, instead of one per request.
+        self.translation_loop = AsyncLoopThread()
+        self.translation_backend = createTranslationBackend()
+        self.translation_service = TranslationService(
+            self.translation_loop, self.googleTranslate,
+            cache=TranslationCache(), backend=self.translation_backend.name)
+        return self.translation_service
+
     def startMangaOCR(self):
-        self.updateStatusBar("Awaiting character recognition module to load")
+        if self.is_ocr_load_started:
+            return
+        self.is_ocr_load_started = True
+        if self.ocr_engine_error:
+            self.updateStatusBar(f"ERROR: {self.ocr_engine_error}")
+        else:
+            self.updateStatusBar("Awaiting character recognition module to load")
 
         # Run the initialization in a background thread
         future = self.executor.submit(self.loadMangaOCRModule)
         future.add_done_callback(self.onMangaOCRLoaded)
 
     def loadMangaOCRModule(self):
+        # an ocr daemon already running has the model loaded
+        from OCRDaemon import connectToDaemon
+        client = connectToDaemon(engine_id=getOCREngineId(self.ocr_engine_name))
+        if client:
+            print(f'using the OCR daemon on {client.socket_path}')
+            return client
         # Initialize manga-ocr (this is the heavy part)
-        self.updateStatusBar("Initializing manga-ocr in the background...")
-        manga_ocr_module = importlib.import_module("manga_ocr")
-        return manga_ocr_module.MangaOcr()
+        self.ocrLoadStatus.emit(f"Initializing manga-ocr ({self.ocr_engine_name}) in the background...")
+        return createOCREngine(self.ocr_engine_name)
 
     def onMangaOCRLoaded(self, future):
+        # runs on the thread that loaded the ocr, so no widgets here
         try:
-            # Get the initialized manga-ocr instance
-            self.manga_ocr_instance = future.result()
-            self.updateStatusBar("manga-ocr initialized and ready!")
-
-            # Now you can use self.manga_ocr_instance for OCR tasks
-            """
-            if self.manga_ocr_instance:
-                try:
-                    # Example OCR usage
-                    text = self.manga_ocr_instance("path_to_manga_image.png")
-                    self.updateStatusBar(f"OCR Result: {text}")
-                except Exception as e:
-                    self.updateStatusBar(f"OCR failed: {e}")
-            """
+            self.ocrEngineLoaded.emit(future.result(), '')
         except Exception as e:
-            self.updateStatusBar(f"Failed to initialize manga-ocr: {e}")
-
-    def qpixmapToPIL(self, pixmap):
-        # Convert QPixmap to QImage
-        qimage = pixmap.toImage()
-
-        # Convert QImage to Pillow Image
-        if qimage.format() == QImage.Format.Format_ARGB32:
-            # Convert ARGB32 to RGBA
-            qimage = qimage.convertToFormat(QImage.Format.Format_RGBA8888)
-
-        # Access the raw image data
-        ptr = qimage.bits()
-        ptr.setsize(qimage.height() * qimage.bytesPerLine())
-
-        # Create a Pillow Image from the raw data
-        return Image.frombuffer(
-            "RGBA",  # Mode (RGBA for 32-bit images)
-            (qimage.width(), qimage.height()),  # Size
-            ptr,  # Raw data
-            "raw",  # Decoder
-            "RGBA",  # Raw mode
-            qimage.bytesPerLine(),  # Stride (bytes per line)
-            1  # Orientation
-        )
-
-    async def googleTranslate(self, list, rect, text, dest="es"):
-        async with Translator() as translator:
-            result = await translator.translate(text, dest=dest)
-            rect.machine_translation = result.text
+            self.ocrEngineLoaded.emit(None, f'{e}')
 
-            print(f'try to transalte "{text}"\n --> {result.text}')
-            self.updateInfoAreas(list, rect)
+    def onOCREngineLoaded(self, engine, error):
+        if engine == None:
+            self.is_ocr_load_failed = True
+            self.updateStatusBar(f"Failed to initialize manga-ocr: {error}")
+        else:
+            self.manga_ocr_instance = engine
+            self.job_queue.ocr_engine = engine
+            if hasattr(engine, 'socket_path'):
+                self.updateStatusBar("manga-ocr ready (shared OCR daemon)")
+            elif self.ocr_engine_error:
+                self.updateStatusBar(f"manga-ocr ready, ERROR: {self.ocr_engine_error}")
+            else:
+                self.updateStatusBar("manga-ocr initialized and ready!")
+            self.startup_times['ocr_ready'] = time.perf_counter() - STARTUP_TIME
+        self.reportStartupTimes()
+        # the detection of all the pages was waiting for the ocr
+        self.requestNextDetections()
+
+    async def googleTranslate(self, text, dest="es"):
+        # this only runs on the translation loop
+        result = await self.translation_backend.translate(text, 'auto', dest)
+        print(f'try to transalte "{text}"\n --> {result}')
+        return result
     
     def applyOCR(self, list, rect):
-        pixmap = rect.image
         if not self.manga_ocr_instance:
+            self.startMangaOCR() # asked before the delayed load started
             self.updateStatusBar("ERROR: OCR module is not ready!!!")
             return
 
-        if pixmap.isNull():
-            self.updateStatusBar("ERROR: Try to parsed invalid pixmap")
+        if self.selected_page_index == None:
+            self.updateStatusBar("ERROR: Try to parsed a rect without page")
             return
 
-        # Convert QPixmap to Pillow Image
-        pil_image = self.qpixmapToPIL(pixmap)
+        # the worker crops the rect from the cpu side copy of the page
+        self.submitPageOCR(self.selected_page_index, [(rect.id, rect.getDefinition())])
+        self.updateStatusBar("Recognizing characters...")
+
+    def submitPageOCR(self, page_index, regions):
+        # regions is a list of (rect_id, definition), they wait on the gui
+        # thread while the page buffer is made on a worker.
+        page_buffer = LIST_QT_PIXMAPS.findPageBuffer(page_index)
+        if page_buffer != None:
+            return sum(self.job_queue.submitOCR(page_index, rect_id, page_buffer, definition)
+                       for (rect_id, definition) in regions)
+        path = LIST_QT_PIXMAPS.getPath(page_index)
+        waiting = self.regions_waiting_buffer.setdefault(path, [])
+        if not waiting:
+            self.page_buffer_executor.submit(self.buildPageBuffer, path)
+        waiting.extend((page_index, rect_id, definition) for (rect_id, definition) in regions)
+        return len(regions)
+
+    def buildPageBuffer(self, path):
+        # decoded again from the file, QPixmap can not be read from here
+        try:
+            image = decodePage(path)
+            page_buffer = None if image.isNull() else PageBuffer(image)
+        except Exception as e:
+            print(f'Failed to make the page buffer of {path}: {e}')
+            page_buffer = None
+        self.pageBufferReady.emit(path, page_buffer)
+
+    def onPageBufferReady(self, path, page_buffer):
+        waiting = self.regions_waiting_buffer.pop(path, [])
+        if page_buffer == None:
+            self.updateStatusBar(f"ERROR: Can not read {path} for the OCR")
+            return
+        LIST_QT_PIXMAPS.putPageBuffer(path, page_buffer)
+        for (page_index, rect_id, definition) in waiting:
+            if page_index < len(LIST_QT_PIXMAPS.pages) and LIST_QT_PIXMAPS.getPath(page_index) == path:
+                self.job_queue.submitOCR(page_index, rect_id, page_buffer, definition)
+
+    def queuePendingOCR(self):
+        # send every area without detected characters, from all the pages,
+        # to the job queue so they can be recognized in batches.
+        if not self.manga_ocr_instance:
+            self.startMangaOCR() # asked before the delayed load started
+            self.updateStatusBar("ERROR: OCR module is not ready!!!")
+            return
+        number_queued = 0
+        for page_index in range(len(LIST_QT_PIXMAPS.pages)):
+            if page_index == self.selected_page_index:
+                pending = [(rect.id, rect.getDefinition())
+                           for rect in self.view.list_of_draw_rects
+                           if not rect.detected_characters]
+            else:
+                pending = [(text['id'], getTextDefinition(text))
+                           for text in LIST_QT_PIXMAPS.getListTexts(page_index)
+                           if not text['raw_text']]
+            if not pending:
+                continue
+            number_queued += self.submitPageOCR(page_index, pending)
+        self.updateStatusBar(f"{number_queued} areas queued for character recognition")
+
+    def detectPageRegions(self):
+        if self.selected_page_index == None:
+            self.updateStatusBar("ERROR: There is no page to look for text regions")
+            return
+        page_index = self.selected_page_index
+        # without a page buffer yet, the detector makes it on its worker
+        self.bubble_detector.request(page_index, LIST_QT_PIXMAPS.getPath(page_index),
+                                     LIST_QT_PIXMAPS.findPageBuffer(page_index))
+        self.updateStatusBar("Looking for text regions...")
+
+    def detectAllRegions(self):
+        # every page is decoded and searched on the detector worker, and
+        # the regions found are sent to the ocr as each page is done.
+        if self.is_loading_proyect:
+            self.updateStatusBar("ERROR: Wait until the proyect is loaded")
+            return
+        number_pages = len(LIST_QT_PIXMAPS.pages)
+        for page_index in range(number_pages):
+            if not page_index in self.pages_to_recognize:
+                self.pages_to_recognize.add(page_index)
+                self.pages_to_detect.append(page_index)
+        self.updateStatusBar(f"Looking for text regions on {number_pages} pages...")
+        if not self.manga_ocr_instance:
+            self.startMangaOCR()
+        self.requestNextDetections()
 
-        if pil_image:
-            # Run OCR on the image
-            detection_result = ''
-            try:
-                text = self.manga_ocr_instance(pil_image)
-                detection_result = f"OCR Result: {text}"
-                rect.detected_characters = text
-                asyncio.run(
-                    self.googleTranslate(list, rect, text, dest="es")
-                )
-            except Exception as e:
-                detection_result = f"OCR failed: {e}"
-                rect.detected_characters = '[OCR FAILED]'
-            self.updateStatusBar(detection_result)
-            self.updateInfoAreas(list, rect)
+    def requestNextDetections(self):
+        # the detection goes only a little ahead of the ocr, and waits
+        # for it to load, so the regions are never left unrecognized.
+        if not self.manga_ocr_instance and not self.is_ocr_load_failed:
+            return
+        while (self.pages_to_detect and len(self.pages_detecting) < MAX_PAGES_DETECTING and
+               self.job_queue.getNumberPendingOCR() < DETECTION_OCR_BACKLOG):
+            page_index = self.pages_to_detect.popleft()
+            self.pages_detecting.add(page_index)
+            self.bubble_detector.request(page_index, LIST_QT_PIXMAPS.getPath(page_index))
+
+    def onRegionsDetected(self, generation, page_index, path, definitions, page_buffer):
+        if generation != self.bubble_detector.generation:
+            return # it belongs to a list of images already closed
+        self.pages_detecting.discard(page_index)
+        if page_index >= len(LIST_QT_PIXMAPS.pages) or LIST_QT_PIXMAPS.getPath(page_index) != path:
+            return
+        LIST_QT_PIXMAPS.putPageBuffer(path, page_buffer)
+        is_on_screen = page_index == self.selected_page_index
+        if is_on_screen:
+            existing = self.view.getTextSelections()
         else:
-            self.label.setText("Failed to convert image.")
+            existing = LIST_QT_PIXMAPS.getListTexts(page_index)
+        # the user may have drawn some of them while the detector was working
+        definitions = filterNewRegions(definitions, [getTextDefinition(text) for text in existing])
+        new_texts = [{
+            'initial_pos': QPointF(x, y),
+            'end_pos': QPointF(x + w, y + h),
+            'id': uuid(),
+            'raw_text': None,
+            'machine_translation': None
+        } for (x, y, w, h) in definitions]
+        if new_texts:
+            if is_on_screen:
+                # they are normal areas, to be moved, resized or removed
+                self.view.addTextSelections(new_texts)
+            else:
+                LIST_QT_PIXMAPS.saveTextSelections(page_index, existing + new_texts)
+
+        if not page_index in self.pages_to_recognize:
+            self.updateStatusBar(f"{len(new_texts)} text regions found on page {page_index + 1}")
+            return
+        self.pages_to_recognize.discard(page_index)
+        if not self.manga_ocr_instance:
+            self.updateStatusBar(f"{len(new_texts)} text regions found on page {page_index + 1}, "
+                                 "but the OCR module failed to load")
+        else:
+            for text in new_texts:
+                self.job_queue.submitOCR(page_index, text['id'], page_buffer, getTextDefinition(text))
+            self.updateStatusBar(
+                f"{len(new_texts)} text regions found on page {page_index + 1}, "
+                f"{len(self.pages_to_recognize)} pages left")
+        self.requestNextDetections()
+
+    def onRegionsDetectionFailed(self, generation, page_index, error):
+        if generation != self.bubble_detector.generation:
+            return
+        self.pages_detecting.discard(page_index)
+        self.pages_to_recognize.discard(page_index)
+        self.updateStatusBar(f"ERROR: Failed to look for text regions on page {page_index + 1}: {error}")
+        self.requestNextDetections()
+
+    def findRect(self, page_index, rect_id):
+        if page_index != self.selected_page_index:
+            return None
+        return self.view.rects_by_id.get(rect_id)
+
+    def onOCRFinished(self, page_index, rect_id, text):
+        self.requestNextDetections() # with room on the ocr queue
+        stats = self.ocr_cache.getStats()
+        self.updateStatusBar(
+            f"OCR Result: {text} (cache hits: {stats['hits']}, misses: {stats['misses']})")
+        self.search_index.updateText(page_index, rect_id, 'raw_text', text)
+        rect = self.findRect(page_index, rect_id)
+        if rect:
+            rect.detected_characters = text
+            # with the characters set this will also queue the translation
+            self.updateInfoAreas(self.view.list_of_draw_rects, rect)
+            return
+        # the page is not on screen anymore, keep the result on the proyect
+        text_info = LIST_QT_PIXMAPS.findText(page_index, rect_id)
+        if text_info:
+            text_info['raw_text'] = text
+            LIST_QT_PIXMAPS.markDirty(page_index)
+            self.job_queue.submitTranslation(page_index, rect_id, text, dest="es")
+
+    def onOCRFailed(self, page_index, rect_id, error):
+        self.requestNextDetections()
+        self.updateStatusBar(f"OCR failed: {error}")
+        self.search_index.updateText(page_index, rect_id, 'raw_text', None)
+        rect = self.findRect(page_index, rect_id)
+        if rect:
+            rect.detected_characters = '[OCR FAILED]'
+            self.updateInfoAreas(self.view.list_of_draw_rects, rect)
+            return
+        text_info = LIST_QT_PIXMAPS.findText(page_index, rect_id)
+        if text_info:
+            text_info['raw_text'] = '[OCR FAILED]'
+            LIST_QT_PIXMAPS.markDirty(page_index)
+
+    def onTranslationFinished(self, page_index, rect_id, text):
+        self.search_index.updateText(page_index, rect_id, 'machine_translation', text)
+        rect = self.findRect(page_index, rect_id)
+        if rect:
+            rect.machine_translation = text
+            self.updateInfoAreas(self.view.list_of_draw_rects, rect)
+            return
+        text_info = LIST_QT_PIXMAPS.findText(page_index, rect_id)
+        if text_info:
+            text_info['machine_translation'] = text
+            LIST_QT_PIXMAPS.markDirty(page_index)
 
+    def onTranslationFailed(self, page_index, rect_id, error):
+        self.updateStatusBar(f"Translation failed: {error}")
+
+    def indexPageTexts(self, page_index, list_texts):
+        self.search_index.indexPage(
+            page_index, [textEntryToData(text) for text in list_texts])
+
+    def searchText(self, query):
+        # the rects of the page on screen may have changed since it was indexed
+        if self.selected_page_index != None:
+            self.indexPageTexts(self.selected_page_index, self.view.getTextSelections())
+        return self.search_index.search(query)
+
+    def goToSearchResult(self, page_index, rect_id):
+        if page_index >= len(LIST_QT_PIXMAPS.pages):
+            return
+        if page_index != self.selected_page_index:
+            self.putOnDrawingAreaImage(page_index)
+        rect = self.view.rects_by_id.get(UUID(rect_id))
+        if rect == None:
+            return
+        self.view.centerOn(rect.getCenter())
+        self.area_details.goToDetails(rect)
 
     def updateInfoAreas(self, list_of_draw_rects, active_rect = None):
         print(f'now list of rects has {len(list_of_draw_rects)} rects!')
-        self.area_details.clearListRects()
-        self.area_details.addRectsToList(list_of_draw_rects)
+        self.area_details.setListRects(list_of_draw_rects)
         # update the details only when a new rect is added or click on a existing one
         if active_rect and active_rect in list_of_draw_rects:
             self.area_details.clearRectDetails()
             self.area_details.updateTabPageTranslation(active_rect)
 
             # this is the part were we do the ocr stuff
+            if self.job_queue.isPending(active_rect.id):
+                return
             if not active_rect.detected_characters:
                 self.applyOCR(list_of_draw_rects, active_rect)
             elif (not active_rect.machine_translation and
                 active_rect.detected_characters != '[OCR FAILED]'):
-                asyncio.run(
-                    self.googleTranslate(list_of_draw_rects ,active_rect, active_rect.detected_characters, dest="es")
-                )
+                self.job_queue.submitTranslation(
+                    self.selected_page_index,
+                    active_rect.id,
+                    active_rect.detected_characters,
+                    dest="es")
 
     def launchOpenFolderDialog(self):
         # Open a folder dialog
@@ -388,34 +688,69 @@ class MainWindow(QMainWindow):
         global LIST_QT_PIXMAPS
 
         print(f'loading picture: {image_path}')
-        pixmap = QPixmap(image_path)
-        pixmap_index = LIST_QT_PIXMAPS.pushPage(pixmap, image_path)
-
-        # Create a button with the thumbnail as an icon
-        thumbnail = QIcon(pixmap.scaled(100, 100, Qt.AspectRatioMode.KeepAspectRatio))  # Scale to thumbnail
-
-        print(f'thumbnail is {type(thumbnail)}, index: {pixmap_index}')
+        pixmap_index = LIST_QT_PIXMAPS.pushPage(image_path)
+        self.addImageButton(pixmap_index, image_path)
+        return pixmap_index
 
-        button = QPushButton()
-        button.setIcon(thumbnail)
-        button.setIconSize(QSize(100, 100))
+    def addImageButton(self, pixmap_index, image_path):
+        # Create a button that gets the thumbnail as an icon when
+        # it is ready, until then it shows the number of the page.
+        button = QPushButton(f'{pixmap_index + 1}')
+        button.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        button.setMinimumHeight(THUMBNAIL_SIZE)
+        self.thumbnail_loader.request(pixmap_index, image_path)
         button.clicked.connect(lambda : self.putOnDrawingAreaImage(pixmap_index))  # Connect click event
         self.section1.addImageTumbnail(button)
-        return pixmap_index
+
+    def onThumbnailReady(self, generation, page_index, thumbnail):
+        if generation != self.thumbnail_loader.generation:
+            return # it belongs to a list of images already closed
+        self.section1.setImageTumbnailIcon(page_index, QIcon(QPixmap.fromImage(thumbnail)))
+
+    def onPagePrefetched(self, path, image, page_buffer):
+        self.page_prefetcher.takeFinished(path)
+        if not path in self.page_prefetcher.wanted_paths:
+            return # the user already went somewhere else
+        LIST_QT_PIXMAPS.putDecodedPage(path, QPixmap.fromImage(image))
+        LIST_QT_PIXMAPS.putPageBuffer(path, page_buffer)
+
+    def clearImageList(self):
+        self.proyect_loader.cancel()
+        self.search_index.clear()
+        self.is_loading_proyect = False
+        self.thumbnail_loader.cancelPending()
+        self.page_prefetcher.cancelAll()
+        self.bubble_detector.cancelPending()
+        self.pages_to_recognize.clear()
+        self.pages_to_detect.clear()
+        self.pages_detecting.clear()
+        self.regions_waiting_buffer = {}
+        self.section1.clearImageList()
+        # the page on screen belongs to the proyect being closed
+        if self.selected_page_index != None:
+            self.selected_page_index = None
+            self.view.clear()
+            self.updateInfoAreas([])
+            self.scene.clear()
 
     def putOnDrawingAreaImage(self, index):
         global LIST_QT_PIXMAPS
         path = LIST_QT_PIXMAPS.getPath(index)
+        if not LIST_QT_PIXMAPS.isPageDecoded(index):
+            prefetched = self.page_prefetcher.waitFor(path)
+            if prefetched:
+                LIST_QT_PIXMAPS.putDecodedPage(path, QPixmap.fromImage(prefetched))
         pixmap = LIST_QT_PIXMAPS.getPixmap(index)
         text_selections = LIST_QT_PIXMAPS.getListTexts(index)
 
 
         if self.selected_page_index != None:
-            LIST_QT_PIXMAPS.saveTextSelections(
-                self.selected_page_index,
-                self.view.getTextSelections())
+            list_texts = self.view.getTextSelections()
+            LIST_QT_PIXMAPS.saveTextSelections(self.selected_page_index, list_texts)
+            self.indexPageTexts(self.selected_page_index, list_texts)
         
         self.selected_page_index = index
+        LIST_QT_PIXMAPS.setPagesOnScreen([index])
         self.is_showing_order = LIST_QT_PIXMAPS.getPageGuiInfo(index, "showing_order")
         self.is_showing_overlay_text = LIST_QT_PIXMAPS.getPageGuiInfo(index, "showing_overlay_text")
 
@@ -424,8 +759,10 @@ class MainWindow(QMainWindow):
         self.updateInfoAreas([]) # clear the list on the rect
         self.scene.clear()
         
-        # Add new image to scene
-        self.pixmap_current_item = self.scene.addPixmap(pixmap)
+        # Add new image to scene, painted by tiles
+        self.pixmap_current_item = TiledPageItem(pixmap)
+        self.pixmap_current_item.setZValue(-1) # always under the selections
+        self.scene.addItem(self.pixmap_current_item)
         self.scene.setSceneRect(QRectF(pixmap.rect()))
 
         
@@ -434,15 +771,19 @@ class MainWindow(QMainWindow):
         self.view.addTextSelections(text_selections)
         self.view.updateArrorws()
 
+        self.page_prefetcher.prefetchAround(index, LIST_QT_PIXMAPS)
+
 
     def loadImage(self, folder):
         global LIST_QT_PIXMAPS
-        self.section1.clearImageList()
+        # a new list of images, do not autosave it over the old proyect
+        self.closeJournal()
+        self.clearImageList()
         LIST_QT_PIXMAPS.clear()
 
         # Load images from the folder
         for filename in os.listdir(folder):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
                 self.addImage(os.path.join(folder, filename))
 
 
@@ -464,53 +805,58 @@ class MainWindow(QMainWindow):
                 self,
                 "Open Gomata File",
                 "",
-                "Gomata File (*.gmt);;All Files (*.*)"
+                "Gomata File (*.gmt *.gmtdb);;All Files (*.*)"
             )
         if not filename:
             return
 
-        content = None
-        with open(filename, 'r', encoding="utf-8") as content_file:
-            content = content_file.read()
+        self.closeJournal()
+        self.clearImageList()
+        LIST_QT_PIXMAPS.clear()
+        self.current_file_name = filename
 
-        if not content:
+        store = None
+        if isStorePath(filename):
+            # the texts of each page are read from the store when needed
+            store = ProyectStore(filename)
+            LIST_QT_PIXMAPS.setStore(store)
+        # the first page is shown as soon as it arrives, the
+        # others keep arriving on background to the side bar.
+        self.is_loading_proyect = True
+        self.proyect_loader.load(filename, store, self.search_index)
+        self.updateStatusBar(f"Opening {filename}...")
+
+    def onProyectPagesLoaded(self, generation, first_index, pages):
+        global LIST_QT_PIXMAPS
+        if not self.proyect_loader.isCurrent(generation):
             return
-
-        self.current_file_name = filename
-        self.section1.clearImageList()
-        LIST_QT_PIXMAPS.clear()
-        
-        parsed = json.loads(content)
-        pages = parsed['pages']
-        for index, page in enumerate(pages):
-            self.addImage(page['path'])
-            print(index, page)
-            gui_info = page['gui_info']
-            LIST_QT_PIXMAPS.setPageGuiInfo(
-                index,
-                "showing_order", gui_info.get('showing_order') )
-            LIST_QT_PIXMAPS.setPageGuiInfo(
-                index,
-                "showing_overlay_text", gui_info.get('showing_overlay_text') )
-             
-            
-            text_on_page = []
-            for text_info in page['text']:
-                start = text_info['start']
-                end = text_info['end']
-                text_on_page.append({
-                'initial_pos': QPointF( start['x'], start['y'] ),
-                'end_pos':QPointF( end['x'], end['y'] ),
-                'id': UUID(text_info['id']),
-                'raw_text': text_info.get('raw_text'),
-                'machine_translation': text_info.get('machine_translation')
-                })
-
-            LIST_QT_PIXMAPS.saveTextSelections( index, text_on_page)
-        
-        if len(LIST_QT_PIXMAPS.pages) > 0:
+        for (path, gui_info, texts_data) in pages:
+            index = LIST_QT_PIXMAPS.pushLoadedPage(path, gui_info, texts_data)
+            self.addImageButton(index, path)
+        if first_index == 0 and self.selected_page_index == None:
             self.putOnDrawingAreaImage(0)
 
+    def onProyectLoadFinished(self, generation, number_recovered):
+        global LIST_QT_PIXMAPS
+        if not self.proyect_loader.isCurrent(generation):
+            return
+        self.is_loading_proyect = False
+        # the pages already changed while loading stay as dirty
+        LIST_QT_PIXMAPS.needs_full_save = False
+        self.updateStatusBar(f"{len(LIST_QT_PIXMAPS.pages)} pages loaded")
+        if isStorePath(self.current_file_name):
+            return
+        self.proyect_journal = ProyectJournal(self.current_file_name, number_recovered)
+        if number_recovered > 0:
+            self.updateStatusBar(f"Recovered {number_recovered} unsaved changes")
+            self.proyect_journal.compact(LIST_QT_PIXMAPS.toData())
+
+    def onProyectLoadFailed(self, generation, error):
+        if not self.proyect_loader.isCurrent(generation):
+            return
+        self.is_loading_proyect = False
+        self.current_file_name = None
+        self.updateStatusBar(f"Failed to open the proyect: {error}")
 
     def saveGomataFile(self):
         global LIST_QT_PIXMAPS
@@ -520,27 +866,115 @@ class MainWindow(QMainWindow):
                 self,
                 "Save Selection",
                 "",
-                "Gomata File (*.gmt);;All Files (*.*)"
+                "Gomata File (*.gmt);;Gomata Database (*.gmtdb);;All Files (*.*)"
             )
 
         if not self.current_file_name:
             print('can not get filename...')
             return
         
-        if not self.current_file_name.endswith(".gmt"):
+        if not (self.current_file_name.endswith(".gmt") or
+                isStorePath(self.current_file_name)):
             self.current_file_name += ".gmt"
         print(f'saving to {self.current_file_name}')
-        
+        if self.is_loading_proyect:
+            # saving now would write only the pages that arrived
+            self.updateStatusBar("Wait until the proyect finishes loading to save it")
+            return
+        # only the changes go to the journal, it is folded into the .gmt
+        # by the compaction timer, past JOURNAL_MAX_RECORDS and on close.
+        self.saveProyect()
+        self.updateStatusBar(f"Saved {self.current_file_name}")
+
+    def saveProyect(self):
+        # only the pages that changed since the last save are written,
+        # as records on the journal, the .gmt file is rewritten whole
+        # only when there is no journal for it or on compaction.
+        global LIST_QT_PIXMAPS
         # recal data from current active page...
         if self.selected_page_index != None:
             LIST_QT_PIXMAPS.saveTextSelections(
                 self.selected_page_index,
                 self.view.getTextSelections())
 
-        f = open(self.current_file_name, "w",  encoding="utf-8")
-        f.write(LIST_QT_PIXMAPS.toString())
-        f.close()
-        set_mime_type_linux(self.current_file_name)
+        if isStorePath(self.current_file_name):
+            self.saveProyectStore()
+            return
+
+        if (self.proyect_journal == None or
+            self.proyect_journal.gmt_path != self.current_file_name or
+            LIST_QT_PIXMAPS.needs_full_save):
+            self.closeJournal()
+            self.proyect_journal = ProyectJournal(self.current_file_name)
+            self.proyect_journal.compact(LIST_QT_PIXMAPS.toData())
+            LIST_QT_PIXMAPS.markAllSaved()
+            self.executor.submit(set_mime_type_linux, self.current_file_name)
+            return
+
+        self.proyect_journal.append(LIST_QT_PIXMAPS.takeChanges())
+        if self.proyect_journal.number_records > JOURNAL_MAX_RECORDS:
+            self.compactProyect()
+
+    def saveProyectStore(self):
+        # the store takes the same records of the journal, applied
+        # on a transaction, so there is nothing to compact later.
+        store = LIST_QT_PIXMAPS.store
+        if (store == None or store.path != self.current_file_name or
+            LIST_QT_PIXMAPS.needs_full_save):
+            data = LIST_QT_PIXMAPS.toData()
+            store = ProyectStore(self.current_file_name)
+            store.writeData(data)
+            LIST_QT_PIXMAPS.setStore(store)
+            LIST_QT_PIXMAPS.markAllSaved()
+            return
+        store.applyRecords(LIST_QT_PIXMAPS.takeChanges())
+
+    def autosaveProyect(self):
+        # nothing is saved until the user picks where
+        if self.current_file_name == None or self.is_loading_proyect:
+            return
+        if self.proyect_journal == None and LIST_QT_PIXMAPS.store == None:
+            return
+        self.saveProyect()
+
+    def compactProyect(self):
+        if self.proyect_journal == None or self.proyect_journal.number_records == 0:
+            return
+        self.proyect_journal.compact(LIST_QT_PIXMAPS.toData())
+
+    def closeJournal(self):
+        if self.proyect_journal == None:
+            return
+        self.proyect_journal.close()
+        self.proyect_journal = None
+
+    def changeEvent(self, event):
+        # no need to animate the selections while nobody is looking
+        view = getattr(self, "view", None)
+        if event.type() == QEvent.Type.ActivationChange and view:
+            view.animation_clock.setPaused(not self.isActiveWindow())
+        super().changeEvent(event)
+
+    def closeEvent(self, event):
+        self.autosaveProyect()
+        self.closeJournal()
+        LIST_QT_PIXMAPS.setStore(None)
+        # do not wait for the pending ocr/translation jobs
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if hasattr(self.manga_ocr_instance, 'close'):
+            self.manga_ocr_instance.close() # the connection to the ocr daemon
+        self.proyect_loader.shutdown()
+        self.thumbnail_loader.shutdown()
+        self.page_prefetcher.shutdown()
+        self.bubble_detector.shutdown()
+        self.page_buffer_executor.shutdown(wait=False, cancel_futures=True)
+        if self.translation_loop != None:
+            try:
+                self.translation_loop.submit(self.translation_backend.close()).result(timeout=2)
+            except Exception as e:
+                print(f'Failed to close the translator: {e}')
+            self.translation_loop.stop()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':